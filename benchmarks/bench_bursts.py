@@ -0,0 +1,77 @@
+"""Compare model calls and batch time with and without burst grouping on a synthetic burst corpus.
+
+Usage: python -m benchmarks.bench_bursts [--scenes 20] [--frames 5] [--size 1920x1280] [--model-latency 0.2]
+
+Every scene is shot as a burst of slightly shifted, rescaled and re-exposed
+frames. The batch runs through MetadataEngine.process_batch with a mocked
+model twice, with group_bursts off and on, and the perceptual-hash pass is
+timed on its own. No Streamlit or API key is needed.
+"""
+import argparse
+import tempfile
+import threading
+import time
+
+from benchmarks.bench_pipeline import MockModel
+from benchmarks.corpus import make_bursts, parse_sizes
+from engine import MetadataEngine
+from perceptual_hash import DEFAULT_BURST_THRESHOLD, group_bursts
+
+
+class CountingModel(MockModel):
+    """MockModel that counts the requests it receives."""
+
+    def __init__(self, latency):
+        super().__init__(latency)
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def generate_content(self, contents, **kwargs):
+        with self.lock:
+            self.calls += 1
+        return super().generate_content(contents, **kwargs)
+
+
+# Function to run one batch; returns (model calls, seconds, results)
+def run_batch(sources, model_latency, group, threshold):
+    model = CountingModel(model_latency)
+    engine = MetadataEngine(model, requests_per_minute=60000, group_bursts=group, burst_threshold=threshold)
+    start = time.perf_counter()
+    results = engine.process_batch(sources)
+    return model.calls, time.perf_counter() - start, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scenes', type=int, default=20)
+    parser.add_argument('--frames', type=int, default=5, help="frames per burst")
+    parser.add_argument('--size', default='1920x1280')
+    parser.add_argument('--model-latency', type=float, default=0.2, help="seconds per mocked model call")
+    parser.add_argument('--threshold', type=int, default=DEFAULT_BURST_THRESHOLD)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        paths = make_bursts(work_dir, parse_sizes(args.size)[0], args.scenes, args.frames)
+        sources = []
+        for path in paths:
+            with open(path, 'rb') as f:
+                sources.append((path, f.read()))
+
+        start = time.perf_counter()
+        clusters = group_bursts([data for _, data in sources], args.threshold)
+        hash_seconds = time.perf_counter() - start
+        # Frames of a scene are generated consecutively, so a correct clustering is contiguous runs
+        expected = [list(range(scene * args.frames, (scene + 1) * args.frames)) for scene in range(args.scenes)]
+        print(f"{len(sources)} frames, {len(clusters)} clusters "
+              f"({'matches' if clusters == expected else 'differs from'} the {args.scenes} scenes), "
+              f"hashed in {hash_seconds * 1000:.0f} ms ({hash_seconds / len(sources) * 1000:.1f} ms/frame)")
+
+        print(f"{'group_bursts':<14}{'model calls':>12}{'seconds':>10}{'failed':>8}")
+        for group in (False, True):
+            calls, elapsed, results = run_batch(sources, args.model_latency, group, args.threshold)
+            failed = sum(1 for result in results if not result.ok)
+            print(f"{str(group):<14}{calls:>12}{elapsed:>10.2f}{failed:>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""Compare the file-based iptcinfo3 embedding with in-memory APP13 splicing.
+
+Usage: python -m benchmarks.bench_embed [--sizes 4000x3000,6000x4000] [--repeat 5]
+
+The file-based path repeats what embed_metadata did per image: write the
+upload to a temp file, Image.open it, parse and rewrite it with iptcinfo3,
+rename it and read it back for the zip. The in-memory path splices the
+IPTC segment into the uploaded bytes with embed_iptc_bytes.
+"""
+import argparse
+import logging
+import os
+import statistics
+import tempfile
+import time
+
+import iptcinfo3
+from PIL import Image
+
+from benchmarks.corpus import DEFAULT_SIZES, make_corpus, parse_sizes
+from iptc_splice import embed_iptc_bytes
+
+METADATA = {
+    'Title': "Morning light over a quiet mountain lake with pine trees",
+    'Tags': "lake,mountain,morning,pine,reflection,water,nature,landscape,calm,sunrise",
+}
+
+
+# Function to run the previous temp-file based embedding on uploaded bytes
+def embed_with_files(data, temp_dir):
+    image_path = os.path.join(temp_dir, 'upload.jpg')
+    with open(image_path, 'wb') as f:
+        f.write(data)
+    Image.open(image_path)
+    iptc_data = iptcinfo3.IPTCInfo(image_path, force=True)
+    for tag in iptc_data._data:
+        iptc_data._data[tag] = []
+    iptc_data['keywords'] = [METADATA['Tags']]
+    iptc_data['caption/abstract'] = [METADATA['Title']]
+    iptc_data.save()
+    new_image_path = os.path.join(temp_dir, 'renamed.jpg')
+    os.rename(image_path, new_image_path)
+    with open(new_image_path, 'rb') as f:
+        result = f.read()
+    os.remove(new_image_path)
+    return result
+
+
+# Function to return the median time of a callable over several runs
+def median_time(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=parse_sizes, default=DEFAULT_SIZES, help="comma-separated WxH list")
+    parser.add_argument('--corpus', help="directory for the synthetic JPEGs (default: temporary)")
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    # iptcinfo3 logs a warning for every file without IPTC data
+    logging.getLogger('iptcinfo').setLevel(logging.ERROR)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        paths = make_corpus(args.corpus or temp_dir, args.sizes)
+        work_dir = os.path.join(temp_dir, 'work')
+        os.makedirs(work_dir)
+
+        print(f"{'image':<28}{'size KB':>9}{'files ms':>11}{'memory ms':>11}{'speedup':>9}")
+        for path in paths:
+            with open(path, 'rb') as f:
+                data = f.read()
+            with_files = median_time(lambda: embed_with_files(data, work_dir), args.repeat)
+            in_memory = median_time(lambda: embed_iptc_bytes(data, METADATA), args.repeat)
+            print(f"{os.path.basename(path):<28}{len(data) / 1024:>9.0f}{with_files * 1000:>11.2f}"
+                  f"{in_memory * 1000:>11.2f}{with_files / in_memory:>8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
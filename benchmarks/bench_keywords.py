@@ -0,0 +1,95 @@
+"""Time keyword post-processing and the batch near-duplicate pass on synthetic model output.
+
+Usage: python -m benchmarks.bench_keywords [--images 5000] [--duplicates 0.05] [--repeat 5]
+
+The per-image path compares the previous inline post-processing (re.findall,
+lowercasing, list(set(...))[:49], normalize_text) with keywords.single_word_tags.
+The batch pass runs find_near_duplicates over every image and reports how
+many of the injected near-duplicates it found.
+"""
+import argparse
+import itertools
+import random
+import re
+import statistics
+import time
+import unicodedata
+
+from keywords import find_near_duplicates, single_word_tags
+
+# Vocabulary the synthetic titles and keywords are drawn from: ~3000 made-up words, a few accented
+SYLLABLES = ("ka", "lo", "mi", "ne", "ru", "sa", "te", "vi", "po", "da", "fe", "go", "hu", "ja", "bé")
+VOCABULARY = [first + second + third for first, second, third in itertools.product(SYLLABLES, repeat=3)]
+
+
+# Function to run the previous per-image keyword post-processing
+def legacy_single_word_tags(tags_text):
+    keywords = re.findall(r'\w+', tags_text)
+    keywords = [word.lower() for word in keywords]
+    unique_keywords = list(set(keywords))[:49]
+    normalized = unicodedata.normalize('NFKD', ','.join(unique_keywords).strip()).encode('ascii', 'ignore').decode('utf-8')
+    return normalized
+
+
+# Function to build model-like output: a title and 49 comma-separated keywords, some repeated in other case
+def make_batch(images, duplicate_fraction, seed=7):
+    rng = random.Random(seed)
+    batch = []
+    injected = set()
+    for index in range(images):
+        if batch and rng.random() < duplicate_fraction:
+            # A near-duplicate: an earlier image's output with one keyword swapped
+            title, keywords = batch[rng.randrange(len(batch))]
+            keywords = keywords.split(', ')
+            keywords[-1] = rng.choice(VOCABULARY)
+            batch.append((title, ', '.join(keywords)))
+            injected.add(index)
+            continue
+        words = rng.sample(VOCABULARY, 49)
+        words += [word.capitalize() for word in rng.sample(words, 5)]
+        title = ' '.join(rng.sample(VOCABULARY, 8)).capitalize()
+        batch.append((title, ', '.join(words)))
+    return batch, injected
+
+
+# Function to return the median time of a callable over several runs
+def median_time(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--images', type=int, default=5000)
+    parser.add_argument('--duplicates', type=float, default=0.05, help="fraction of injected near-duplicates")
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    batch, injected = make_batch(args.images, args.duplicates)
+
+    legacy = median_time(lambda: [legacy_single_word_tags(tags) for _, tags in batch], args.repeat)
+    current = median_time(lambda: [single_word_tags(tags) for _, tags in batch], args.repeat)
+    print(f"{'step':<28}{'images':>8}{'total ms':>12}{'us/image':>10}")
+    print(f"{'legacy keyword processing':<28}{len(batch):>8}{legacy * 1000:>12.1f}{legacy / len(batch) * 1e6:>10.1f}")
+    print(f"{'single_word_tags':<28}{len(batch):>8}{current * 1000:>12.1f}{current / len(batch) * 1e6:>10.1f}")
+
+    metadata = [{'Title': title, 'Tags': single_word_tags(tags)} for title, tags in batch]
+    duplicates = {}
+
+    def detect():
+        duplicates.clear()
+        duplicates.update(find_near_duplicates(metadata))
+
+    elapsed = median_time(detect, args.repeat)
+    print(f"{'find_near_duplicates':<28}{len(batch):>8}{elapsed * 1000:>12.1f}{elapsed / len(batch) * 1e6:>10.1f}")
+
+    found = len(injected & set(duplicates))
+    print(f"near-duplicates: {len(duplicates)} flagged, {found}/{len(injected)} injected found")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""Compare the full-size model payload with the downscaled one from prepare_model_image.
+
+Usage: python -m benchmarks.bench_payload [--sizes 4000x3000,6000x4000] [--max-edge 1024]
+
+The full-size path is what the app did before: the SDK sends the original
+JPEG bytes of an image opened from disk. End-to-end latency is modelled as
+encode time + upload time at --bandwidth-mbps + a fixed --model-latency.
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+from benchmarks.corpus import DEFAULT_SIZES, make_corpus, parse_sizes
+from image_payload import DEFAULT_MAX_EDGE, DEFAULT_QUALITY, prepare_model_image
+
+
+# Function to build the payload of the previous full-size path
+def full_size_payload(image_path):
+    with open(image_path, 'rb') as f:
+        return {'mime_type': 'image/jpeg', 'data': f.read()}
+
+
+# Function to time a payload builder over several runs
+def measure(build, image_path, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        payload = build(image_path)
+        timings.append(time.perf_counter() - start)
+    return len(payload['data']), statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=parse_sizes, default=DEFAULT_SIZES, help="comma-separated WxH list")
+    parser.add_argument('--corpus', help="directory for the synthetic JPEGs (default: temporary)")
+    parser.add_argument('--max-edge', type=int, default=DEFAULT_MAX_EDGE)
+    parser.add_argument('--quality', type=int, default=DEFAULT_QUALITY)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--bandwidth-mbps', type=float, default=20.0, help="upload bandwidth to the API")
+    parser.add_argument('--model-latency', type=float, default=1.5, help="seconds the model takes per call")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        paths = make_corpus(args.corpus or temp_dir, args.sizes)
+
+        def thumbnail(path):
+            return prepare_model_image(path, args.max_edge, args.quality)
+
+        print(f"{'image':<28}{'path':<11}{'payload KB':>12}{'encode ms':>12}{'e2e s':>9}")
+        for path in paths:
+            for label, build in (('full', full_size_payload), ('thumbnail', thumbnail)):
+                size, encode = measure(build, path, args.repeat)
+                upload = size * 8 / (args.bandwidth_mbps * 1e6)
+                e2e = encode + upload + args.model_latency
+                print(f"{os.path.basename(path):<28}{label:<11}{size / 1024:>12.0f}{encode * 1000:>12.1f}{e2e:>9.2f}")
+
+
+if __name__ == '__main__':
+    main()
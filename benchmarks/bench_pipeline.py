@@ -0,0 +1,150 @@
+"""Time every stage of the processing pipeline on a synthetic JPEG corpus.
+
+Usage: python -m benchmarks.bench_pipeline [--sizes 1920x1280,6000x4000] [--count 5] [--json report.json]
+
+Stages: save (spool the upload to disk), decode (model payload), model (a
+mocked Gemini model with --model-latency), embed (IPTC splice), zip and
+sftp (upload to a local paramiko SFTP server). Reports p50/p95 latency and
+images/sec per stage, so a regression in any one of them is visible.
+No Streamlit or API key is needed.
+"""
+import argparse
+import io
+import json
+import math
+import os
+import tempfile
+import time
+import zipfile
+
+from benchmarks.corpus import make_corpus, parse_sizes
+from benchmarks.local_sftp_server import LocalSFTPServer
+from generation import request_metadata_json
+from image_payload import prepare_model_image
+from iptc_splice import embed_iptc_bytes
+from sftp_transfer import SFTPTransferPool
+from spooling import spool_upload
+
+DEFAULT_BENCH_SIZES = [(1920, 1280), (4000, 3000), (6000, 4000)]
+
+PROMPT = "Return a JSON object with a 'title' and a 'keywords' field for this image."
+
+
+class MockResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class MockModel:
+    """Stands in for GenerativeModel: sleeps for `latency` seconds and returns fixed JSON."""
+
+    def __init__(self, latency):
+        self.latency = latency
+
+    def generate_content(self, contents, **kwargs):
+        time.sleep(self.latency)
+        return MockResponse(json.dumps({
+            'title': "Morning light over a quiet mountain lake with pine trees",
+            'keywords': ['lake', 'mountain', 'morning', 'pine', 'reflection', 'water', 'nature'],
+        }))
+
+
+# Function to compute a nearest-rank percentile of a list of timings
+def percentile(values, fraction):
+    ordered = sorted(values)
+    rank = max(1, math.ceil(fraction * len(ordered)))
+    return ordered[rank - 1]
+
+
+# Function to time fn(value) for every value; returns (outputs, timings)
+def time_stage(fn, values):
+    outputs, timings = [], []
+    for value in values:
+        start = time.perf_counter()
+        outputs.append(fn(value))
+        timings.append(time.perf_counter() - start)
+    return outputs, timings
+
+
+def summarize(name, timings):
+    total = sum(timings)
+    return {
+        'stage': name,
+        'images': len(timings),
+        'p50_ms': percentile(timings, 0.50) * 1000,
+        'p95_ms': percentile(timings, 0.95) * 1000,
+        'images_per_sec': len(timings) / total if total > 0 else 0.0,
+    }
+
+
+def run(paths, work_dir, model_latency):
+    uploads = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            uploads.append((os.path.basename(path), f.read()))
+
+    report = []
+
+    def save(upload):
+        name, data = upload
+        spool_path = os.path.join(work_dir, name)
+        spool_upload(io.BytesIO(data), spool_path)
+        return spool_path
+
+    spooled, timings = time_stage(save, uploads)
+    report.append(summarize('save', timings))
+
+    payloads, timings = time_stage(prepare_model_image, spooled)
+    report.append(summarize('decode', timings))
+
+    model = MockModel(model_latency)
+    results, timings = time_stage(lambda payload: request_metadata_json(model, payload, PROMPT), payloads)
+    report.append(summarize('model', timings))
+    metadata = {'Title': results[0][0], 'Tags': ','.join(results[0][1])}
+
+    embedded, timings = time_stage(lambda upload: (upload[0], embed_iptc_bytes(upload[1], metadata)), uploads)
+    report.append(summarize('embed', timings))
+
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as zipf:
+        _, timings = time_stage(lambda item: zipf.writestr(*item), embedded)
+    report.append(summarize('zip', timings))
+
+    remote_dir = os.path.join(work_dir, 'remote')
+    os.makedirs(remote_dir)
+    with LocalSFTPServer(remote_dir) as server:
+        with SFTPTransferPool(server.host, server.port, 'bench', server.password, connections=1) as pool:
+            # Connect before timing so the handshake is not charged to the first file
+            pool.remote_stat('/')
+            _, timings = time_stage(lambda item: pool.upload_bytes(item[1], f"/{item[0]}"), embedded)
+    report.append(summarize('sftp', timings))
+
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=parse_sizes, default=DEFAULT_BENCH_SIZES, help="comma-separated WxH list")
+    parser.add_argument('--count', type=int, default=5, help="images per size")
+    parser.add_argument('--corpus', help="directory for the synthetic JPEGs (default: temporary)")
+    parser.add_argument('--model-latency', type=float, default=0.05, help="seconds the mocked model takes per call")
+    parser.add_argument('--json', help="also write the report to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        paths = make_corpus(args.corpus or os.path.join(temp_dir, 'corpus'), args.sizes, args.count)
+        work_dir = os.path.join(temp_dir, 'work')
+        os.makedirs(work_dir)
+        report = run(paths, work_dir, args.model_latency)
+
+    print(f"{'stage':<8}{'images':>8}{'p50 ms':>10}{'p95 ms':>10}{'img/s':>10}")
+    for row in report:
+        print(f"{row['stage']:<8}{row['images']:>8}{row['p50_ms']:>10.2f}{row['p95_ms']:>10.2f}{row['images_per_sec']:>10.1f}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'sizes': [f"{w}x{h}" for w, h in args.sizes], 'count': args.count, 'stages': report}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+import os
+import random
+
+from PIL import Image, ImageChops, ImageDraw, ImageEnhance
+
+# Default synthetic image sizes: web, 12 MP, 24 MP and 50 MP originals
+DEFAULT_SIZES = [(1920, 1280), (4000, 3000), (6000, 4000), (8688, 5792)]
+
+
+# Function to parse "WxH,WxH" into a list of sizes
+def parse_sizes(text):
+    sizes = []
+    for item in text.split(','):
+        width, height = item.lower().split('x')
+        sizes.append((int(width), int(height)))
+    return sizes
+
+
+# Function to create one photo-like JPEG (noise over gradients compresses like a real photo)
+def make_jpeg(path, size, quality=92):
+    width, height = size
+    gradient = Image.linear_gradient('L').resize(size)
+    noise = Image.effect_noise(size, 48)
+    img = Image.merge('RGB', (noise, gradient, gradient.transpose(Image.Transpose.FLIP_LEFT_RIGHT)))
+    img.save(path, format='JPEG', quality=quality)
+    return path
+
+
+# Function to write a synthetic corpus of JPEGs, `count` images per size
+def make_corpus(directory, sizes=DEFAULT_SIZES, count=1):
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for width, height in sizes:
+        for i in range(count):
+            path = os.path.join(directory, f"synthetic_{width}x{height}_{i + 1}.jpg")
+            if not os.path.exists(path):
+                make_jpeg(path, (width, height))
+            paths.append(path)
+    return paths
+
+
+# Function to draw a random scene of shapes over a gradient
+def make_scene(size, seed):
+    rng = random.Random(seed)
+    width, height = size
+    img = Image.merge('RGB', [Image.linear_gradient('L').rotate(rng.choice((0, 90, 180, 270))).resize(size)
+                              for _ in range(3)])
+    draw = ImageDraw.Draw(img)
+    for _ in range(12):
+        x, y = rng.randrange(width), rng.randrange(height)
+        w, h = rng.randrange(width // 8, width // 2), rng.randrange(height // 8, height // 2)
+        colour = tuple(rng.randrange(256) for _ in range(3))
+        (draw.ellipse if rng.random() < 0.5 else draw.rectangle)((x - w // 2, y - h // 2, x + w // 2, y + h // 2), fill=colour)
+    return img
+
+
+# Function to write bursts: `frames` slightly shifted, re-exposed and noisy shots of each of `scenes` scenes
+def make_bursts(directory, size=(1920, 1280), scenes=10, frames=5, seed=0):
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for scene_index in range(scenes):
+        scene = make_scene(size, seed * 1000 + scene_index)
+        rng = random.Random(-1 - seed * 1000 - scene_index)
+        for frame in range(frames):
+            shot = ImageChops.offset(scene, rng.randint(-size[0] // 100, size[0] // 100), rng.randint(-size[1] // 100, size[1] // 100))
+            shot = ImageEnhance.Brightness(shot).enhance(rng.uniform(0.92, 1.08))
+            noise = Image.effect_noise(size, 12).convert('RGB')
+            shot = Image.blend(shot, noise, 0.08)
+            path = os.path.join(directory, f"burst_{scene_index + 1:03d}_{frame + 1}.jpg")
+            shot.save(path, format='JPEG', quality=90)
+            paths.append(path)
+    return paths
@@ -0,0 +1,195 @@
+"""Local paramiko-based SFTP server standing in for the contributor endpoint.
+
+Usage: python -m benchmarks.local_sftp_server ROOT_DIR [--port 2222]
+
+It accepts any username with the configured password and serves ROOT_DIR,
+which makes it possible to exercise SFTPTransferPool (parallel channels,
+reconnects, remote stat checks) without touching the real server.
+"""
+import argparse
+import os
+import socket
+import threading
+
+import paramiko
+from paramiko.sftp import SFTP_NO_SUCH_FILE, SFTP_OK, SFTP_PERMISSION_DENIED
+
+
+class _Server(paramiko.ServerInterface):
+    def __init__(self, password):
+        self.password = password
+
+    def check_auth_password(self, username, password):
+        if password == self.password:
+            return paramiko.AUTH_SUCCESSFUL
+        return paramiko.AUTH_FAILED
+
+    def get_allowed_auths(self, username):
+        return 'password'
+
+    def check_channel_request(self, kind, chanid):
+        if kind == 'session':
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+
+class _Handle(paramiko.SFTPHandle):
+    def stat(self):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def chattr(self, attr):
+        return SFTP_OK
+
+
+class _SFTPInterface(paramiko.SFTPServerInterface):
+    root = None
+
+    def _local(self, path):
+        path = os.path.normpath('/' + path).lstrip('/')
+        return os.path.join(self.root, path)
+
+    def list_folder(self, path):
+        local = self._local(path)
+        try:
+            entries = []
+            for name in os.listdir(local):
+                attr = paramiko.SFTPAttributes.from_stat(os.stat(os.path.join(local, name)))
+                attr.filename = name
+                entries.append(attr)
+            return entries
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def stat(self, path):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.stat(self._local(path)))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    lstat = stat
+
+    def open(self, path, flags, attr):
+        local = self._local(path)
+        try:
+            fd = os.open(local, flags | getattr(os, 'O_BINARY', 0), 0o644)
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        if flags & os.O_WRONLY:
+            mode = 'ab' if flags & os.O_APPEND else 'wb'
+        elif flags & os.O_RDWR:
+            mode = 'a+b' if flags & os.O_APPEND else 'r+b'
+        else:
+            mode = 'rb'
+        handle = _Handle(flags)
+        handle.filename = local
+        handle.readfile = handle.writefile = os.fdopen(fd, mode)
+        return handle
+
+    def remove(self, path):
+        try:
+            os.remove(self._local(path))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return SFTP_OK
+
+    def rename(self, oldpath, newpath):
+        try:
+            os.replace(self._local(oldpath), self._local(newpath))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return SFTP_OK
+
+    def posix_rename(self, oldpath, newpath):
+        return self.rename(oldpath, newpath)
+
+    def mkdir(self, path, attr):
+        try:
+            os.mkdir(self._local(path))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return SFTP_OK
+
+    def chattr(self, path, attr):
+        if not os.path.exists(self._local(path)):
+            return SFTP_NO_SUCH_FILE
+        return SFTP_OK
+
+    def symlink(self, target_path, path):
+        return SFTP_PERMISSION_DENIED
+
+
+class LocalSFTPServer:
+    """Threaded SFTP server on 127.0.0.1 serving `root`; use as a context manager."""
+
+    def __init__(self, root, password='secret', port=0):
+        self.root = root
+        self.password = password
+        self.host_key = paramiko.RSAKey.generate(2048)
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind(('127.0.0.1', port))
+        self.socket.listen(16)
+        self.host, self.port = self.socket.getsockname()
+        self.transports = []
+        self.connections = 0
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        self._thread.start()
+
+    def _serve(self):
+        sftp_interface = type('RootedSFTPInterface', (_SFTPInterface,), {'root': self.root})
+        while not self._stopped.is_set():
+            try:
+                client, _ = self.socket.accept()
+            except OSError:
+                break
+            transport = paramiko.Transport(client)
+            transport.add_server_key(self.host_key)
+            transport.set_subsystem_handler('sftp', paramiko.SFTPServer, sftp_interface)
+            transport.start_server(server=_Server(self.password))
+            self.transports.append(transport)
+            self.connections += 1
+
+    def drop_connections(self):
+        """Close every open transport, simulating a network blip."""
+        for transport in self.transports:
+            transport.close()
+        self.transports = []
+
+    def stop(self):
+        self._stopped.set()
+        self.socket.close()
+        self.drop_connections()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('root')
+    parser.add_argument('--port', type=int, default=2222)
+    parser.add_argument('--password', default='secret')
+    args = parser.parse_args()
+
+    os.makedirs(args.root, exist_ok=True)
+    server = LocalSFTPServer(args.root, args.password, args.port)
+    print(f"Serving {args.root} on sftp://{server.host}:{server.port} (password: {args.password})")
+    server.start()
+    try:
+        server._thread.join()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+
+import metrics
+from iptc_splice import embed_iptc_bytes
+
+# Worker processes of the pool that embeds files on disk. Every process that embeds files
+# (the Streamlit server, the CLI, each job_worker process) starts its own pool of this size
+DEFAULT_EMBED_WORKERS = os.cpu_count() or 1
+
+
+# Function to embed metadata into one image file and move it to its new name
+def embed_file(image_path, metadata, new_filename=None):
+    """Splice IPTC metadata into a JPEG on disk; returns the (possibly renamed) path.
+
+    The new content is written to a temporary file next to the original and
+    moved into place, so a crash never leaves a half-written image behind.
+    """
+    with open(image_path, 'rb') as f:
+        data = embed_iptc_bytes(f.read(), metadata)
+
+    directory = os.path.dirname(image_path)
+    new_image_path = os.path.join(directory, new_filename) if new_filename else image_path
+    temp_path = f"{new_image_path}.part"
+    with open(temp_path, 'wb') as f:
+        f.write(data)
+    os.replace(temp_path, new_image_path)
+    if new_image_path != image_path:
+        os.remove(image_path)
+    return new_image_path
+
+
+# Function run for every item: a path is embedded on disk (in a pool process), bytes are returned embedded
+def _embed_item(source, metadata, new_filename):
+    # The time and size are measured here and recorded by the parent, whose metrics are exported
+    start = time.perf_counter()
+    if isinstance(source, str):
+        result = embed_file(source, metadata, new_filename)
+        size = os.path.getsize(result)
+    else:
+        result = new_filename, embed_iptc_bytes(source, metadata)
+        size = len(result[1])
+    return result, time.perf_counter() - start, size
+
+
+# The pool is created lazily and reused by every batch of this process, so batches don't pay
+# for process start-up. Its processes come from a fork server rather than forking the
+# caller, which may be the multi-threaded Streamlit server
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_embed_pool(workers=DEFAULT_EMBED_WORKERS):
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else None)
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+        return _pool
+
+
+def embed_batch(items, on_progress=None, pool=None):
+    """Embed (source, metadata, new_filename) items.
+
+    A source is either a file path, embedded in place and renamed to
+    new_filename (returns the new path), or JPEG bytes (returns
+    (new_filename, embedded_bytes)). Paths go to the process pool, where
+    the file I/O overlaps; bytes are spliced in the calling thread, since
+    the splice takes well under a millisecond and sending multi-MB images to
+    another process and back costs several times that. Returns (result,
+    error) tuples in input order; exactly one of the two is None.
+    on_progress(done, total) is called from the calling thread, so it is
+    safe to update a Streamlit progress bar from it.
+    """
+    items = list(items)
+    completed = queue.Queue()
+    results = [None] * len(items)
+
+    for i, (source, metadata, new_filename) in enumerate(items):
+        if isinstance(source, str):
+            pool = pool or get_embed_pool()
+            future = pool.submit(_embed_item, source, metadata, new_filename)
+            future.add_done_callback(lambda future, i=i: completed.put((i, future)))
+
+    def inline():
+        for i, (source, metadata, new_filename) in enumerate(items):
+            if not isinstance(source, str):
+                future = Future()
+                try:
+                    future.set_result(_embed_item(source, metadata, new_filename))
+                except Exception as e:
+                    future.set_exception(e)
+                yield i, future
+
+    inline_items = inline()
+    for done in range(1, len(items) + 1):
+        # Bytes are embedded between collecting the pool's completions
+        i, future = next(inline_items, None) or completed.get()
+        try:
+            result, seconds, size = future.result()
+            metrics.observe(metrics.STAGE_SECONDS, seconds, stage='embed')
+            metrics.record_bytes('embed', size)
+            results[i] = (result, None)
+        except Exception as e:
+            metrics.inc(metrics.STAGE_ERRORS, stage='embed')
+            results[i] = (None, e)
+        if on_progress:
+            on_progress(done, len(items))
+
+    return results
@@ -0,0 +1,476 @@
+import io
+import os
+import threading
+import time
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import metrics
+from embedding import embed_batch
+from generation import (DEFAULT_REQUESTS_PER_MINUTE, DEFAULT_WORKERS, RateLimitedModel, generate_metadata_batch,
+                        get_limiter, request_metadata_json)
+from image_payload import prepare_model_image
+from iptc_splice import embed_iptc_bytes
+from job_manifest import DONE, hash_bytes
+from keywords import FILENAME_UNSAFE_CHARS, filter_tags, find_near_duplicates, fold_ascii, single_word_tags
+from perceptual_hash import DEFAULT_BURST_THRESHOLD, burst_title, group_bursts
+from pipeline import Stage, run_pipeline
+
+# Gemini model used for titles and tags unless a page or the CLI picks another one
+DEFAULT_MODEL_NAME = 'gemini-1.5-flash'
+
+
+# Function to normalize and clean text
+def normalize_text(text):
+    return FILENAME_UNSAFE_CHARS.sub('', fold_ascii(text))  # Remove characters not allowed in filenames
+
+
+# Function to name a processed image after its generated title
+def title_filename(metadata):
+    title = normalize_text(metadata['Title'])
+    return f"{title}.jpg"
+
+
+# Function to avoid overwriting images that were given the same title
+def unique_filename(filename, used_filenames):
+    stem, ext = os.path.splitext(filename)
+    candidate = filename
+    counter = 2
+    while candidate.lower() in used_filenames:
+        candidate = f"{stem}_{counter}{ext}"
+        counter += 1
+    used_filenames.add(candidate.lower())
+    return candidate
+
+
+class PromptSet:
+    """Title and tag prompts plus the post-processing applied to the model's tags."""
+
+    def __init__(self, title_prompt, tags_prompt, format_tags):
+        self.title_prompt = title_prompt
+        self.tags_prompt = tags_prompt
+        self.format_tags = format_tags
+        self.combined_prompt = (
+            "Return a JSON object with a 'title' and a 'keywords' field for this image. "
+            f"title: {title_prompt} keywords: {tags_prompt}"
+        )
+
+    def build_metadata(self, title_text, tags_text):
+        return {
+            'Title': title_text.strip(),  # Remove leading/trailing whitespace
+            'Tags': self.format_tags(tags_text),
+        }
+
+
+MANUAL_PROMPTS = PromptSet(
+    "Help create a specific, descriptive, and informative title for an image. The title should clearly describe the context, subject, and atmosphere of the scene, make the result into 1 line or answer only",
+    "Generate 49 keywords in one line, separated by commas, based on an image. Ensure the first 5 keywords are the most relevant to the image, followed by related terms that describe the context, subject, and details of the scene, each keyword is a single word.",
+    filter_tags,
+)
+
+SFTP_PROMPTS = PromptSet(
+    "Create a descriptive title in English up to 12 words long. Ensure the keywords accurately reflect the subject matter, context, and main elements of the image, using precise terms that capture unique aspects like location, activity, or theme for specificity. Maintain variety and consistency in keywords relevant to the image content. Avoid using brand names or copyrighted elements in the title.",
+    "Generate up to 49 keywords relevant to the image (each keyword must be one word, separated by commas). Avoid using brand names or copyrighted elements in the keywords.",
+    single_word_tags,
+)
+
+PROMPT_SETS = {'manual': MANUAL_PROMPTS, 'sftp': SFTP_PROMPTS}
+
+
+# Function to create a Gemini model with its own client, so sessions with different API keys never share one
+def create_model(api_key, model_name=DEFAULT_MODEL_NAME):
+    # Imported here: the SDK and gRPC take a while to load and only matter once a batch runs
+    import google.ai.generativelanguage as glm
+    import google.generativeai as genai
+
+    model = genai.GenerativeModel(model_name)
+    # genai.configure() would set a process-wide key; the model otherwise picks up that default client.
+    # GenerativeModel takes no client argument, so this relies on its private _client (see requirements.txt)
+    model._client = glm.GenerativeServiceClient(client_options={'api_key': api_key})
+    return model
+
+
+# Models kept per process, and how long an unused one is kept
+MAX_CACHED_MODELS = 32
+MODEL_IDLE_SECONDS = 30 * 60
+
+# One model per API key and model name, shared by every session, batch and rerun, so its
+# gRPC channel stays open between batches instead of being rebuilt on every click.
+# Least recently used first; dropped models close their channel once no batch holds them
+_models = OrderedDict()
+_models_lock = threading.Lock()
+
+
+def get_model(api_key, model_name=DEFAULT_MODEL_NAME):
+    key = (api_key, model_name)
+    now = time.monotonic()
+    with _models_lock:
+        entry = _models.pop(key, None)
+        model = entry[0] if entry is not None else create_model(api_key, model_name)
+        _models[key] = (model, now)
+        # Forget keys nobody has used for a while, and the oldest beyond the limit
+        while _models:
+            oldest_key, (_, last_used) = next(iter(_models.items()))
+            if oldest_key == key or (len(_models) <= MAX_CACHED_MODELS and now - last_used < MODEL_IDLE_SECONDS):
+                break
+            del _models[oldest_key]
+        return model
+
+
+# Function to load the downscaled copy sent to the model from JPEG bytes or a path
+def _model_image(source):
+    with metrics.timed('decode'):
+        return prepare_model_image(source if isinstance(source, str) else io.BytesIO(source))
+
+
+# Function to derive the metadata of one frame from the metadata generated for its burst
+def burst_metadata(metadata, number, size):
+    if size == 1:
+        return metadata
+    # Numbered titles keep the title-based filenames of a burst apart
+    return dict(metadata, Title=burst_title(metadata['Title'], number))
+
+
+class FileResult:
+    """Outcome of one image in a batch: metadata, output filename and data, or the error and failing stage."""
+
+    def __init__(self, name, source=None):
+        self.name = name
+        self.source = source
+        self.metadata = None
+        self.filename = None
+        self.data = None
+        self.path = None
+        self.skipped = False
+        self.error = None
+        self.stage = None
+        self.traceback = None
+        self.duplicate_of = None
+        self.burst_of = None
+        self.transfer = None  # TransferResult of the SFTP upload
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def fail(self, stage, error, traceback=None):
+        self.stage = stage
+        self.error = error
+        self.traceback = traceback
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'status': 'skipped' if self.skipped else ('ok' if self.ok else 'failed'),
+            'title': self.metadata.get('Title') if self.metadata else None,
+            'tags': self.metadata.get('Tags') if self.metadata else None,
+            'output': self.filename,
+            'stage': self.stage,
+            'duplicate_of': self.duplicate_of,
+            'burst_of': self.burst_of,
+            'upload_bytes': self.transfer.size if self.transfer else None,
+            'upload_seconds': self.transfer.seconds if self.transfer else None,
+            'upload_bytes_per_second': self.transfer.throughput if self.transfer else None,
+            'error': str(self.error) if self.error is not None else None,
+        }
+
+
+class MetadataEngine:
+    """Generate, embed and package metadata for batches of JPEGs, independent of any UI.
+
+    The Streamlit pages and the headless CLI both drive this class; progress
+    callbacks are always invoked from the calling thread. With group_bursts,
+    near-identical frames (by perceptual hash) are captioned with one model
+    call and get numbered variants of its title.
+    """
+
+    def __init__(self, model, prompts=MANUAL_PROMPTS, model_name=DEFAULT_MODEL_NAME, single_call=True,
+                 cache=None, workers=DEFAULT_WORKERS, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE,
+                 limiter_key=None, group_bursts=False, burst_threshold=DEFAULT_BURST_THRESHOLD, limiter=None):
+        # limiter overrides the in-process bucket of limiter_key, e.g. with one shared across processes
+        self.model = RateLimitedModel(model, limiter or get_limiter(limiter_key, requests_per_minute))
+        self.prompts = prompts
+        self.model_name = model_name
+        self.single_call = single_call
+        self.cache = cache
+        self.workers = workers
+        self.group_bursts = group_bursts
+        self.burst_threshold = burst_threshold
+
+    # Function to generate metadata for images using AI model
+    def generate_metadata(self, model, img):
+        caption = model.generate_content([self.prompts.title_prompt, img])
+        tags = model.generate_content([self.prompts.tags_prompt, img])
+        return self.prompts.build_metadata(caption.text, tags.text)
+
+    # Function to generate metadata with a single structured call, falling back to two calls
+    def generate_metadata_single(self, model, img):
+        result = request_metadata_json(model, img, self.prompts.combined_prompt, self.model_name)
+        if result is None:
+            return self.generate_metadata(model, img)
+        title, keywords = result
+        return self.prompts.build_metadata(title, ','.join(keywords))
+
+    def _generate_fn(self):
+        if self.single_call:
+            generate_fn, prompt = self.generate_metadata_single, self.prompts.combined_prompt
+        else:
+            generate_fn, prompt = self.generate_metadata, self.prompts.title_prompt + self.prompts.tags_prompt
+        if self.cache is not None:
+            # Look up previously generated metadata before calling the model
+            generate_fn = self.cache.cached(generate_fn, prompt, self.model_name)
+        # One 'generate' call per image, whether it hit the cache or took one or two model calls
+        return metrics.instrument('generate', generate_fn)
+
+    def generate(self, data):
+        """Generate metadata for one image given as JPEG bytes or a file path."""
+        # Send a downscaled copy to the model, the original stays untouched
+        return self._generate_fn()(self.model, _model_image(data))
+
+    def generate_batch(self, images, on_progress=None, weights=None):
+        """Generate metadata for a list of JPEG bytes or paths; returns (metadata, error) tuples in order."""
+        return generate_metadata_batch(
+            self._generate_fn(),
+            self.model,
+            images,
+            _model_image,
+            workers=self.workers,
+            on_progress=on_progress,
+            weights=weights,
+        )
+
+    def bursts(self, sources, load=None):
+        """Cluster JPEG bytes or paths into bursts, or one cluster per image when grouping is off.
+
+        load(source), if given, turns each source into bytes or a path; it is
+        only called when grouping is on.
+        """
+        if not self.group_bursts:
+            return [[index] for index in range(len(sources))]
+        with metrics.timed('phash'):
+            clusters = group_bursts([load(source) for source in sources] if load else sources, self.burst_threshold)
+        metrics.inc(metrics.BURST_FRAMES_REUSED, len(sources) - len(clusters))
+        return clusters
+
+    def process_batch(self, sources, on_generate_progress=None, on_embed_progress=None):
+        """Generate and embed metadata for (name, jpeg_bytes_or_path) sources; returns FileResults in order.
+
+        Successful results get a unique title-based `filename`. Bytes sources
+        carry the embedded JPEG bytes in `data`, ready for zip_images or an
+        upload; path sources (spooled copies) are embedded in place on disk
+        and their `path` is set instead, so no image is held in memory.
+        """
+        results = [FileResult(name, data) for name, data in sources]
+
+        # Only the first frame of each burst goes to the model
+        clusters = self.bursts([result.source for result in results])
+        # Progress counts frames, so a burst advances it by its size
+        generated = self.generate_batch([results[cluster[0]].source for cluster in clusters], on_generate_progress,
+                                        weights=[len(cluster) for cluster in clusters])
+        for cluster, (metadata, error) in zip(clusters, generated):
+            for number, index in enumerate(cluster, start=1):
+                result = results[index]
+                if len(cluster) > 1:
+                    result.burst_of = results[cluster[0]].name
+                if error is not None:
+                    result.fail('generate', error)
+                else:
+                    result.metadata = burst_metadata(metadata, number, len(cluster))
+
+        # Splice the metadata into every image across the process pool, in upload order
+        pending = [result for result in results if result.ok]
+        embedded = embed_batch(
+            [(result.source, result.metadata, None if isinstance(result.source, str) else title_filename(result.metadata))
+             for result in pending],
+            on_progress=on_embed_progress,
+        )
+        used_filenames = set()
+        for result, (output, error) in zip(pending, embedded):
+            if error is not None:
+                result.fail('embed', error)
+                continue
+            if isinstance(output, str):
+                filename, result.path = title_filename(result.metadata), output
+            else:
+                filename, result.data = output
+            result.filename = unique_filename(filename, used_filenames)
+            result.source = None
+
+        flag_near_duplicates(results)
+        return results
+
+    def process_sftp(self, sources, pool, remote_dir, manifest, on_progress=None, upload_workers=None):
+        """Stream (name, file) sources through read, check, generate, embed and upload stages.
+
+        `file` is a path, a BytesIO such as Streamlit's UploadedFile (its bytes
+        are used as they are, through getvalue()) or anything with read().
+        Progress is recorded in the job manifest, so a rerun skips files already
+        on the server and reuses their generated metadata. Returns FileResults in input order.
+        Raises before any stage runs if the SFTP server cannot be reached or
+        rejects the credentials.
+        """
+        upload_workers = upload_workers or pool.connections
+        # A wrong password or unreachable server fails the batch before any image is captioned
+        pool.connect()
+
+        # Frames of a burst share one model call: the first to reach the generate
+        # stage calls the model, the others wait on its future
+        sources = list(sources)
+        clusters = self.bursts([file for _, file in sources], _burst_source)
+        cluster_of = {index: cluster for cluster in clusters for index in cluster}
+        burst_futures = {}
+        burst_lock = threading.Lock()
+        sources = [(name, (index, name, file)) for index, (name, file) in enumerate(sources)]
+
+        def read(entry):
+            index, name, file = entry
+            # The source's name is used on the server and in the manifest, whatever the file object is called
+            name = os.path.basename(name)
+            if isinstance(file, str):
+                with open(file, 'rb') as f:
+                    data = f.read()
+            else:
+                data = file.getvalue() if hasattr(file, 'getvalue') else file.read()
+            content_hash = hash_bytes(data)
+            return {
+                'index': index,
+                'data': data,
+                'remote_path': f"{remote_dir.rstrip('/')}/{name}",
+                'hash': content_hash,
+                'record': manifest.record_file(content_hash, name, len(data)),
+                'skipped': False,
+            }
+
+        def check(task):
+            # Skip files whose upload finished earlier and whose remote copy is intact
+            record = task['record']
+            if record['upload_status'] == DONE:
+                attributes = pool.remote_stat(record['remote_path'])
+                task['skipped'] = manifest.is_uploaded(record, attributes)
+                if task['skipped']:
+                    task['data'] = None
+                    task['metadata'] = record['metadata']
+            return task
+
+        def generate(task):
+            if task['skipped']:
+                return task
+            if task['record']['metadata']:
+                task['metadata'] = task['record']['metadata']
+                return task
+            cluster = cluster_of[task['index']]
+            with burst_lock:
+                future = burst_futures.get(cluster[0])
+                leader = future is None
+                if leader:
+                    future = burst_futures[cluster[0]] = Future()
+            if leader:
+                try:
+                    future.set_result(self.generate(task['data']))
+                except Exception as e:
+                    future.set_exception(e)
+            task['metadata'] = burst_metadata(future.result(), cluster.index(task['index']) + 1, len(cluster))
+            manifest.record_metadata(task['hash'], task['metadata'])
+            return task
+
+        def embed(task):
+            if task['skipped']:
+                return task
+            try:
+                with metrics.timed('embed'):
+                    task['data'] = embed_iptc_bytes(task['data'], task['metadata'])
+            except Exception as e:
+                manifest.record_failure(task['hash'], 'embed', e)
+                raise
+            metrics.record_bytes('embed', len(task['data']))
+            manifest.record_embedded(task['hash'], len(task['data']))
+            return task
+
+        def upload(task):
+            if task['skipped']:
+                return task
+            try:
+                result = pool.upload_bytes(task['data'], task['remote_path'])
+            except Exception as e:
+                manifest.record_failure(task['hash'], 'upload', e)
+                raise
+            manifest.record_uploaded(task['hash'], task['remote_path'], result.size, result.remote_mtime)
+            task['transfer'] = result
+            task['data'] = None  # Release the buffer as soon as the file is on the server
+            return task
+
+        stages = [
+            Stage("Read", read),
+            Stage("Checked against server", check, workers=upload_workers),
+            Stage("Generated titles and tags", generate, workers=self.workers),
+            Stage("Embedded metadata", embed),
+            Stage("Uploaded to SFTP", upload, workers=upload_workers),
+        ]
+        items = run_pipeline(sources, stages, on_progress=on_progress)
+
+        results = []
+        for item in items:
+            result = FileResult(item.name)
+            cluster = cluster_of[item.index]
+            if len(cluster) > 1:
+                result.burst_of = items[cluster[0]].name
+            if item.ok:
+                result.metadata = item.value.get('metadata')
+                result.filename = item.value['remote_path']
+                result.skipped = item.value['skipped']
+                result.transfer = item.value.get('transfer')
+            else:
+                result.fail(item.failed_stage, item.error, item.traceback)
+            results.append(result)
+        flag_near_duplicates(results)
+        return results
+
+
+# Function to give the burst pre-pass an SFTP source without consuming it
+def _burst_source(file):
+    if isinstance(file, str):
+        return file
+    if hasattr(file, 'getvalue'):
+        return file.getvalue()
+    return None  # A stream read only once; it is captioned on its own
+
+
+# Function to mark results whose title or keywords nearly repeat an earlier image of the batch
+def flag_near_duplicates(results):
+    # Frames of one burst share their keywords by design, so only the first frame is compared
+    with metrics.timed('dedupe'):
+        duplicates = find_near_duplicates([
+            result.metadata if result.burst_of in (None, result.name) else None for result in results
+        ])
+    for index, (earlier, field, similarity) in duplicates.items():
+        results[index].duplicate_of = results[earlier].name
+    return duplicates
+
+
+# Function to zip (filename, jpeg_bytes) pairs in memory
+def zip_images(images):
+    buffer = io.BytesIO()
+    with metrics.timed('zip'), zipfile.ZipFile(buffer, 'w') as zipf:
+        for filename, data in images:
+            zipf.writestr(filename, data)
+    metrics.record_bytes('zip', buffer.getbuffer().nbytes)
+    return buffer.getvalue()
+
+
+# Function to summarize a batch for the JSON report
+def build_report(results, started, finished=None):
+    finished = finished or time.time()
+    elapsed = finished - started
+    succeeded = sum(1 for result in results if result.ok and not result.skipped)
+    return {
+        'started': started,
+        'finished': finished,
+        'elapsed_seconds': elapsed,
+        'total': len(results),
+        'succeeded': succeeded,
+        'skipped': sum(1 for result in results if result.skipped),
+        'failed': sum(1 for result in results if not result.ok),
+        'images_per_second': succeeded / elapsed if elapsed > 0 else 0.0,
+        'files': [result.to_dict() for result in results],
+    }
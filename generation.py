@@ -0,0 +1,200 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import TypedDict
+
+from tenacity import Retrying, retry_if_exception, stop_after_attempt, wait_random_exponential
+
+import metrics
+
+# Default number of images captioned at the same time
+DEFAULT_WORKERS = 8
+
+# Requests per minute allowed by the Gemini API quota (each image costs up to two requests)
+DEFAULT_REQUESTS_PER_MINUTE = 60
+
+# HTTP status codes worth retrying: rate limited or transient server errors
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+RETRYABLE_ERROR_NAMES = {'ResourceExhausted', 'TooManyRequests', 'InternalServerError',
+                         'ServiceUnavailable', 'DeadlineExceeded', 'BadGateway', 'GatewayTimeout'}
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled at a fixed requests-per-minute rate."""
+
+    def __init__(self, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE, capacity=None):
+        self.rate = requests_per_minute / 60.0
+        self.capacity = capacity or max(1, requests_per_minute // 6)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available, then take it."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+# Function to decide whether an API error is worth retrying
+def is_retryable(error):
+    code = getattr(error, 'code', None)
+    if isinstance(code, int) and code in RETRYABLE_STATUS_CODES:
+        return True
+    return type(error).__name__ in RETRYABLE_ERROR_NAMES
+
+
+# Function to label an API error by its status code, or its type when it has none
+def error_code(error):
+    code = getattr(error, 'code', None)
+    return str(code) if isinstance(code, int) else type(error).__name__
+
+
+class RateLimitedModel:
+    """Wrap a GenerativeModel so every call waits for the limiter and retries 429/5xx errors."""
+
+    def __init__(self, model, limiter, max_attempts=5, max_wait=30):
+        self.model = model
+        self.limiter = limiter
+        self.max_attempts = max_attempts
+        self.max_wait = max_wait
+
+    def generate_content(self, *args, **kwargs):
+        retrying = Retrying(
+            retry=retry_if_exception(is_retryable),
+            wait=wait_random_exponential(multiplier=1, max=self.max_wait),
+            stop=stop_after_attempt(self.max_attempts),
+            before_sleep=lambda retry_state: metrics.inc(metrics.API_RETRIES),
+            reraise=True,
+        )
+        for attempt in retrying:
+            with attempt:
+                with metrics.timed('rate_limit_wait'):
+                    self.limiter.acquire()
+                try:
+                    with metrics.timed('model_call'):
+                        return self.model.generate_content(*args, **kwargs)
+                except Exception as e:
+                    metrics.inc(metrics.API_ERRORS, code=error_code(e))
+                    raise
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+
+# Limiters are shared per API key so concurrent batches respect the same quota
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(api_key, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE):
+    with _limiters_lock:
+        limiter = _limiters.get(api_key)
+        if limiter is None or limiter.rate != requests_per_minute / 60.0:
+            limiter = TokenBucket(requests_per_minute)
+            _limiters[api_key] = limiter
+        return limiter
+
+
+def generate_metadata_batch(generate_fn, model, image_paths, load_image, workers=DEFAULT_WORKERS, on_progress=None,
+                            weights=None):
+    """Run generate_fn(model, load_image(path)) for every path on a thread pool.
+
+    Returns a list of (metadata, error) tuples in the same order as image_paths;
+    exactly one of the two is None. on_progress(done, total) is called from the
+    calling thread, so it is safe to update Streamlit elements from it. With
+    weights, a path counts as that many images towards done and total (the
+    frames of a burst captioned from one path).
+    """
+    results = [None] * len(image_paths)
+    weights = weights or [1] * len(image_paths)
+    total = sum(weights)
+    done = 0
+
+    def run(path):
+        return generate_fn(model, load_image(path))
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = {executor.submit(run, path): i for i, path in enumerate(image_paths)}
+        for future in as_completed(futures):
+            i = futures[future]
+            done += weights[i]
+            try:
+                results[i] = (future.result(), None)
+            except Exception as e:
+                results[i] = (None, e)
+            if on_progress:
+                on_progress(done, total)
+
+    return results
+
+
+class MetadataResponse(TypedDict):
+    title: str
+    keywords: list[str]
+
+
+# Model names that rejected JSON mode; they go straight to the two-call path afterwards
+_json_unsupported = set()
+_json_unsupported_lock = threading.Lock()
+
+
+# Function to tell a rejection of JSON mode apart from other 400 Bad Request errors
+def rejects_json_mode(error):
+    message = str(error).lower()
+    return any(option in message for option in ('response_mime_type', 'response_schema', 'json mode'))
+
+
+# Function to ask for the title and keywords of an image in a single structured call
+def request_metadata_json(model, img, prompt, model_name=None):
+    """Return (title, keywords) from one JSON-mode call, or None if the response is unusable.
+
+    Callers fall back to the two-call path on None. Rate limit and server errors
+    are left to propagate so RateLimitedModel can retry them. Once model_name
+    rejects JSON mode, None is returned without a request.
+    """
+    with _json_unsupported_lock:
+        if model_name is not None and model_name in _json_unsupported:
+            return None
+    try:
+        response = model.generate_content(
+            [prompt, img],
+            generation_config={
+                'response_mime_type': 'application/json',
+                'response_schema': MetadataResponse,
+            },
+        )
+        data = json.loads(response.text)
+    except ValueError:
+        # Malformed JSON, or a blocked response with no text
+        return None
+    except Exception as e:
+        # Models without JSON mode reject the request with 400 Bad Request naming the JSON
+        # options; other 400s (an invalid key, an unreadable image) are the caller's to report
+        if getattr(e, 'code', None) == 400 and rejects_json_mode(e):
+            if model_name is not None:
+                with _json_unsupported_lock:
+                    _json_unsupported.add(model_name)
+            return None
+        raise
+
+    if not isinstance(data, dict):
+        return None
+    title = data.get('title')
+    keywords = data.get('keywords')
+    if isinstance(keywords, str):
+        keywords = keywords.split(',')
+    if not isinstance(title, str) or not title.strip() or not isinstance(keywords, list):
+        return None
+    keywords = [str(keyword).strip() for keyword in keywords if str(keyword).strip()]
+    if not keywords:
+        return None
+    return title.strip(), keywords
@@ -0,0 +1,32 @@
+import io
+
+from PIL import Image, ImageOps
+
+# Longest edge and JPEG quality of the copy sent to the model
+DEFAULT_MAX_EDGE = 1024
+DEFAULT_QUALITY = 85
+
+
+# Function to build a small JPEG payload of an image for the AI model
+def prepare_model_image(image_path, max_edge=DEFAULT_MAX_EDGE, quality=DEFAULT_QUALITY):
+    """Return an inline image part ({'mime_type', 'data'}) no larger than max_edge on its long side.
+
+    JPEGs are decoded with Image.draft(), so libjpeg scales them down in the DCT
+    domain (1/2, 1/4 or 1/8) instead of decoding every pixel of a 50 MP original.
+    The file on disk is only read, never modified, so it stays intact for IPTC
+    embedding and upload.
+    """
+    with Image.open(image_path) as img:
+        # Ask for the target box at the image's own aspect ratio so the largest DCT scale is picked
+        width, height = img.size
+        scale = min(1.0, max_edge / max(width, height))
+        img.draft('RGB', (max(1, int(width * scale)), max(1, int(height * scale))))
+        img.thumbnail((max_edge, max_edge))
+        img = ImageOps.exif_transpose(img)
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+
+        buffer = io.BytesIO()
+        img.save(buffer, format='JPEG', quality=quality)
+
+    return {'mime_type': 'image/jpeg', 'data': buffer.getvalue()}
@@ -0,0 +1,131 @@
+import struct
+
+# JPEG markers
+SOI = b'\xff\xd8'
+APP13 = 0xED
+SOS = 0xDA
+
+# Photoshop image resource block holding IPTC-IIM data
+PHOTOSHOP_SIGNATURE = b'Photoshop 3.0\x00'
+IPTC_RESOURCE_ID = 0x0404
+
+# IIM datasets (record, dataset) written by the app, same as iptcinfo3's 'keywords' and 'caption/abstract'
+CODED_CHARACTER_SET = (1, 90)
+RECORD_VERSION = (2, 0)
+KEYWORDS = (2, 25)
+CAPTION = (2, 120)
+
+# ESC % G: the IIM values are UTF-8
+UTF8_MARKER = b'\x1b%G'
+
+
+# Function to encode one IIM dataset (tag marker, record, dataset, length, value)
+def _dataset(tag, value):
+    record, dataset = tag
+    if len(value) <= 0x7FFF:
+        return struct.pack('>BBBH', 0x1C, record, dataset, len(value)) + value
+    # Extended dataset: the length field holds the size of a 4-byte length that follows
+    return struct.pack('>BBBHI', 0x1C, record, dataset, 0x8004, len(value)) + value
+
+
+# Function to build the IPTC-IIM block for a metadata dict
+def build_iptc(metadata):
+    parts = [
+        _dataset(CODED_CHARACTER_SET, UTF8_MARKER),
+        _dataset(RECORD_VERSION, b'\x00\x04'),
+    ]
+    tags = metadata.get('Tags', '')
+    title = metadata.get('Title', '')
+    if tags:
+        parts.append(_dataset(KEYWORDS, tags.encode('utf-8')))
+    if title:
+        parts.append(_dataset(CAPTION, title.encode('utf-8')))
+    return b''.join(parts)
+
+
+# Function to wrap data in a Photoshop 8BIM image resource
+def _resource(resource_id, data, name=b''):
+    # Pascal-style name padded to an even length, then data padded to an even length
+    pascal = bytes([len(name)]) + name
+    if len(pascal) % 2:
+        pascal += b'\x00'
+    padding = b'\x00' if len(data) % 2 else b''
+    return b'8BIM' + struct.pack('>H', resource_id) + pascal + struct.pack('>I', len(data)) + data + padding
+
+
+# Function to split a Photoshop APP13 payload into its 8BIM resources
+def _parse_resources(payload):
+    resources = []
+    offset = len(PHOTOSHOP_SIGNATURE)
+    while offset + 12 <= len(payload) and payload[offset:offset + 4] == b'8BIM':
+        resource_id = struct.unpack_from('>H', payload, offset + 4)[0]
+        name_length = payload[offset + 6]
+        name_size = name_length + 1 + ((name_length + 1) % 2)
+        name = bytes(payload[offset + 7:offset + 7 + name_length])
+        size_offset = offset + 6 + name_size
+        size = struct.unpack_from('>I', payload, size_offset)[0]
+        data_offset = size_offset + 4
+        resources.append((resource_id, name, bytes(payload[data_offset:data_offset + size])))
+        offset = data_offset + size + (size % 2)
+    return resources
+
+
+# Function to walk the JPEG segments in front of the image data
+def _segments(data):
+    """Yield (marker, start, end) for every segment before Start Of Scan."""
+    offset = 2
+    while offset + 4 <= len(data):
+        if data[offset] != 0xFF:
+            raise ValueError("Invalid JPEG: expected a segment marker")
+        marker = data[offset + 1]
+        if marker == 0xFF:
+            # Fill byte
+            offset += 1
+            continue
+        length = struct.unpack_from('>H', data, offset + 2)[0]
+        yield marker, offset, offset + 2 + length
+        if marker == SOS:
+            return
+        offset += 2 + length
+
+
+def embed_iptc_bytes(data, metadata):
+    """Return a copy of JPEG bytes with the title and keywords written as IPTC.
+
+    Works on the encoded stream only: the Photoshop APP13 segment is replaced
+    (other 8BIM resources in it are kept, existing IPTC is dropped) and no
+    pixel is decoded. The result is ready to be zipped or uploaded.
+    """
+    data = memoryview(data)
+    if data[:2] != SOI:
+        raise ValueError("Invalid JPEG: missing SOI marker")
+
+    kept = [SOI]
+    other_resources = []
+    insert_at = 1
+    in_header = True
+    for marker, start, end in _segments(data):
+        segment = data[start:end]
+        if marker == APP13 and bytes(segment[4:4 + len(PHOTOSHOP_SIGNATURE)]) == PHOTOSHOP_SIGNATURE:
+            other_resources.extend(r for r in _parse_resources(segment[4:]) if r[0] != IPTC_RESOURCE_ID)
+            continue
+        kept.append(segment)
+        # The new APP13 goes after the leading APPn/COM segments (JFIF, Exif, ICC...)
+        if in_header and (0xE0 <= marker <= 0xEF or marker == 0xFE):
+            insert_at = len(kept)
+        else:
+            in_header = False
+        if marker == SOS:
+            kept.append(data[end:])
+            break
+    else:
+        raise ValueError("Invalid JPEG: no image data found")
+
+    payload = PHOTOSHOP_SIGNATURE + b''.join(_resource(resource_id, resource_data, name) for resource_id, name, resource_data in other_resources)
+    payload += _resource(IPTC_RESOURCE_ID, build_iptc(metadata))
+    if len(payload) + 2 > 0xFFFF:
+        raise ValueError("IPTC metadata too large for a single APP13 segment")
+    app13 = b'\xff' + bytes([APP13]) + struct.pack('>H', len(payload) + 2) + payload
+
+    kept.insert(insert_at, app13)
+    return b''.join(kept)
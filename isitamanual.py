@@ -1,17 +1,21 @@
 import streamlit as st
 import os
-import tempfile
-from PIL import Image
-import google.generativeai as genai
-import iptcinfo3
-import zipfile
-import time
 import traceback
-import re
-import unicodedata
 from datetime import datetime, timedelta
 import pytz
-import json
+import time
+from job_manifest import hash_bytes
+from job_queue import FAILED, QUEUED, RUNNING, get_queue
+from job_worker import ensure_workers
+from license_state import license_start_date, save_license_start_date
+from memory_usage import format_size
+
+# Number of images captioned concurrently and the API quota they share
+GENERATION_WORKERS = 8
+REQUESTS_PER_MINUTE = 60
+
+# Gemini model used for titles and tags
+MODEL_NAME = 'gemini-1.5-flash'
 
 st.set_option("client.showSidebarNavigation", False)
 
@@ -37,99 +41,97 @@ JAKARTA_TZ = pytz.timezone('Asia/Jakarta')
 if 'license_validated' not in st.session_state:
     st.session_state['license_validated'] = False
 
-if 'upload_count' not in st.session_state:
-    st.session_state['upload_count'] = {
-        'date': None,
-        'count': 0
-    }
-
 if 'api_key' not in st.session_state:
     st.session_state['api_key'] = None
 
-# Function to normalize and clean text
-def normalize_text(text):
-    normalized = unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode('utf-8')
-    sanitized = re.sub(r'[\\/:*?"<>|]', '', normalized)  # Remove characters not allowed in filenames
-    return sanitized
-
-# Function to generate metadata for images using AI model
-def generate_metadata(model, img):
-    caption = model.generate_content([
-        "Help create a specific, descriptive, and informative title for an image. The title should clearly describe the context, subject, and atmosphere of the scene, make the result into 1 line or answer only", 
-        img
-    ])
-    tags = model.generate_content([
-        "Generate 49 keywords in one line, separated by commas, based on an image. Ensure the first 5 keywords are the most relevant to the image, followed by related terms that describe the context, subject, and details of the scene, each keyword is a single word.", 
-        img
-    ])
-
-    # Filter out undesirable characters from the generated tags
-    filtered_tags = re.sub(r'[^\w\s,]', '', tags.text)
-    
-    # Trim the generated keywords if they exceed 49 words
-    keywords = filtered_tags.split(',')[:49]  # Limit to 49 words
-    trimmed_tags = ','.join(keywords)
-    
-    return {
-        'Title': caption.text.strip(),  # Remove leading/trailing whitespace
-        'Tags': trimmed_tags.strip()
-    }
-
-# Function to embed metadata into images
-def embed_metadata(image_path, metadata, progress_bar, files_processed, total_files):
-    try:
-        # Simulate delay
-        time.sleep(1)
-
-        # Open the image file
-        img = Image.open(image_path)
-
-        # Load existing IPTC data (if any)
-        iptc_data = iptcinfo3.IPTCInfo(image_path, force=True)
-
-        # Clear existing IPTC metadata
-        for tag in iptc_data._data:
-            iptc_data._data[tag] = []
-
-        # Update IPTC data with new metadata
-        iptc_data['keywords'] = [metadata.get('Tags', '')]  # Keywords
-        iptc_data['caption/abstract'] = [metadata.get('Title', '')]  # Title
-
-        # Save the image with the embedded metadata
-        iptc_data.save()
-
-        # Rename the file based on the generated title
-        directory, original_filename = os.path.split(image_path)
-        title = normalize_text(metadata['Title'])
-        new_filename = f"{title}.jpg"
-        new_image_path = os.path.join(directory, new_filename)
-        os.rename(image_path, new_image_path)
-
-        # Update progress bar
-        files_processed += 1
-        progress_bar.progress(files_processed / total_files)
-        progress_bar.text(f"Embedding metadata and renaming image {files_processed}/{total_files}")
-
-        return new_image_path
-
-    except Exception as e:
-        st.error(f"An error occurred while embedding metadata: {e}")
-        st.error(traceback.format_exc())  # Print detailed error traceback for debugging
-
-def zip_processed_images(image_paths):
-    try:
-        zip_file_path = os.path.join(tempfile.gettempdir(), 'processed_images.zip')
-
-        with zipfile.ZipFile(zip_file_path, 'w') as zipf:
-            for image_path in image_paths:
-                zipf.write(image_path, arcname=os.path.basename(image_path))
-
-        return zip_file_path
-
-    except Exception as e:
-        st.error(f"An error occurred while zipping images: {e}")
-        st.error(traceback.format_exc())
-        return None
+# Changing the uploader's key clears it, releasing the uploaded files
+if 'uploader_key' not in st.session_state:
+    st.session_state['uploader_key'] = 0
+
+# Ask for title and keywords in one JSON request instead of two separate calls
+SINGLE_CALL_GENERATION = True
+
+# Uploads allowed per API key per day, counted in the shared job queue
+DAILY_UPLOAD_LIMIT = 1000
+
+# Seconds between status checks while a batch is queued or running
+JOB_POLL_SECONDS = 1.0
+
+# How the workers process this page's batches
+JOB_OPTIONS = {
+    'profile': 'manual',
+    'model_name': MODEL_NAME,
+    'single_call': SINGLE_CALL_GENERATION,
+    'use_cache': True,
+    'workers': GENERATION_WORKERS,
+    'requests_per_minute': REQUESTS_PER_MINUTE,
+}
+
+# Function to show the progress or the result of a queued batch
+def show_job(queue, job_id):
+    job = queue.get(job_id)
+    if job is None:
+        st.session_state.pop('job_id', None)
+        return
+
+    total = job['total']
+    if job['status'] == QUEUED:
+        st.info(f"Batch of {total} images queued, {queue.position(job_id)} batches ahead of it.")
+    elif job['status'] == RUNNING:
+        if job['generated'] < total:
+            st.text(f"Processing Generate Titles and Tags {job['generated']}/{total}")
+        else:
+            st.text(f"Embedding metadata for image {job['embedded']}/{total}")
+        st.progress((job['generated'] + job['embedded']) / (2 * total))
+
+    if job['status'] in (QUEUED, RUNNING):
+        # The batch runs in a worker process; check again shortly
+        time.sleep(JOB_POLL_SECONDS)
+        st.rerun()
+
+    if job['status'] == FAILED:
+        st.error(f"An error occurred: {job['error']}")
+        return
+
+    report = job['report']
+    if 'cache' in report:
+        st.caption(
+            f"Metadata cache: {report['cache']['hits']} hits, {report['cache']['misses']} misses "
+            f"({report['cache']['entries']} entries stored)"
+        )
+
+    st.caption(f"Peak memory of the worker for this batch: {format_size(report['memory']['peak_rss_bytes'])}")
+
+    # Per-stage latency, bytes, retries and API errors, for capacity planning
+    with st.expander("Batch metrics"):
+        st.json(report['metrics'])
+
+    # Report per-file failures after the batch
+    for result in report['files']:
+        if result['status'] == 'failed':
+            action = "generating" if result['stage'] == 'generate' else "embedding"
+            st.error(f"An error occurred while {action} metadata for {result['name']}: {result['error']}")
+
+    # Near-identical titles or keyword sets compete with each other on stock sites
+    duplicates = [result for result in report['files'] if result['duplicate_of']]
+    if duplicates:
+        st.warning("Similar titles or keywords to an earlier image: " + ", ".join(
+            f"{result['name']} (like {result['duplicate_of']})" for result in duplicates))
+
+    if os.path.exists(job['output_path']):
+        st.success(f"Successfully zipped {report['succeeded']} processed images")
+        # Read the zip once per job; later reruns of the page reuse the bytes held by this session
+        cached = st.session_state.get('job_zip')
+        if cached is None or cached[0] != job_id:
+            with open(job['output_path'], 'rb') as f:
+                cached = (job_id, f.read())
+            st.session_state['job_zip'] = cached
+        st.download_button(
+            label="Download processed images",
+            data=cached[1],
+            file_name='processed_images.zip',
+            mime='application/zip'
+        )
 
 def main():
     """Main function for the Streamlit app."""
@@ -145,14 +147,13 @@ def main():
     </div>
     """, unsafe_allow_html=True)
 
-    # Check if license has already been validated
-    license_file = "license.txt"
+    # Check if license has already been validated (read from memory unless license.txt changed)
+    start_date = license_start_date()
+    if start_date is None:
+        st.session_state['license_validated'] = False
     if not st.session_state['license_validated']:
-        if os.path.exists(license_file):
-            with open(license_file, 'r') as file:
-                start_date_str = file.read().strip()
-                start_date = datetime.fromisoformat(start_date_str)
-                st.session_state['license_validated'] = True
+        if start_date is not None:
+            st.session_state['license_validated'] = True
         else:
             # License key input
             validation_key = st.text_input('License Key', type='password')
@@ -164,16 +165,11 @@ def main():
         if validation_key == correct_key:
             st.session_state['license_validated'] = True
             start_date = datetime.now(JAKARTA_TZ)
-            with open(license_file, 'w') as file:
-                file.write(start_date.isoformat())
+            save_license_start_date(start_date)
         else:
             st.error("Invalid validation key. Please enter the correct key.")
 
     if st.session_state['license_validated']:
-        # Check the license file for the start date
-        with open(license_file, 'r') as file:
-            start_date_str = file.read().strip()
-            start_date = datetime.fromisoformat(start_date_str)
 
         # Calculate the expiration date
         expiration_date = start_date + timedelta(days=91)
@@ -193,8 +189,12 @@ def main():
         if api_key:
             st.session_state['api_key'] = api_key
 
+        # Batches and daily upload counts shared by every session on this host
+        queue = get_queue()
+
         # Upload image files
-        uploaded_files = st.file_uploader('Upload Images (Only JPG and JPEG Supported)', accept_multiple_files=True)
+        uploaded_files = st.file_uploader('Upload Images (Only JPG and JPEG Supported)', accept_multiple_files=True,
+                                          key=f"uploader_{st.session_state['uploader_key']}")
 
         if uploaded_files:
             valid_files = [file for file in uploaded_files if file.type in ['image/jpeg', 'image/jpg']]
@@ -203,86 +203,37 @@ def main():
             if invalid_files:
                 st.error("Only JPG and JPEG files are supported.")
 
+            # Near-identical frames get one model call and numbered variants of its title
+            group_bursts = st.checkbox("Caption burst shots once (numbered titles)", value=False)
+
             if valid_files and st.button("Process"):
-                with st.spinner("Processing..."):
-                    try:
-                        # Check and update upload count for the current date
-                        if st.session_state['upload_count']['date'] != current_date.date():
-                            st.session_state['upload_count'] = {
-                                'date': current_date.date(),
-                                'count': 0
-                            }
-                        
-                        # Check if remaining uploads are available
-                        if st.session_state['upload_count']['count'] + len(valid_files) > 1000:
-                            remaining_uploads = 1000 - st.session_state['upload_count']['count']
-                            st.warning(f"You have exceeded the upload limit. Remaining uploads for today: {remaining_uploads}")
-                            return
-                        else:
-                            st.session_state['upload_count']['count'] += len(valid_files)
-                            st.success(f"Uploads successful. Remaining uploads for today: {1000 - st.session_state['upload_count']['count']}")
-
-                        genai.configure(api_key=api_key)  # Configure AI model with API key
-                        model = genai.GenerativeModel('gemini-1.5-flash')
-
-                        # Create a temporary directory to store the uploaded images
-                        with tempfile.TemporaryDirectory() as temp_dir:
-                            # Save the uploaded images to the temporary directory
-                            image_paths = []
-                            for file in valid_files:
-                                temp_image_path = os.path.join(temp_dir, file.name)
-                                with open(temp_image_path, 'wb') as f:
-                                    f.write(file.read())
-                                image_paths.append(temp_image_path)
-
-                            # Process each image and generate titles and tags using AI
-                            metadata_list = []
-                            process_placeholder = st.empty()
-                            for i, image_path in enumerate(image_paths):
-                                process_placeholder.text(f"Processing Generate Titles and Tags {i + 1}/{len(image_paths)}")
-                                try:
-                                    img = Image.open(image_path)
-                                    metadata = generate_metadata(model, img)
-                                    metadata_list.append(metadata)
-                                except Exception as e:
-                                    st.error(f"An error occurred while generating metadata for {os.path.basename(image_path)}: {e}")
-                                    st.error(traceback.format_exc())
-                                    continue
-
-                            # Embed metadata into images
-                            total_files = len(image_paths)
-                            files_processed = 0
-
-                            # Display the progress bar and current file number
-                            progress_placeholder = st.empty()
-                            progress_bar = progress_placeholder.progress(0)
-                            progress_placeholder.text(f"Processing images 0/{total_files}")
-
-                            processed_image_paths = []
-                            for i, (image_path, metadata) in enumerate(zip(image_paths, metadata_list)):
-                                process_placeholder.text(f"Embedding metadata for image {i + 1}/{len(image_paths)}")
-                                updated_image_path = embed_metadata(image_path, metadata, progress_bar, files_processed, total_files)
-                                if updated_image_path:
-                                    processed_image_paths.append(updated_image_path)
-                                    files_processed += 1
-                                    # Update progress bar and current file number
-                                    progress_bar.progress(files_processed / total_files)
-
-                            # Zip processed images
-                            zip_file_path = zip_processed_images(processed_image_paths)
-
-                            if zip_file_path:
-                                st.success(f"Successfully zipped processed {zip_file_path}")
-                                st.download_button(
-                                    label="Download processed images",
-                                    data=open(zip_file_path, 'rb'),
-                                    file_name='processed_images.zip',
-                                    mime='application/zip'
-                                )
-
-                    except Exception as e:
-                        st.error(f"An error occurred: {e}")
-                        st.error(traceback.format_exc())  # Print detailed error traceback for debugging
+                try:
+                    # Uploads are counted per API key in the shared store, so reloads and other sessions see them
+                    owner = hash_bytes(api_key.encode('utf-8'))
+                    allowed, remaining_uploads = queue.reserve_quota(owner, current_date.date().isoformat(), len(valid_files), DAILY_UPLOAD_LIMIT)
+                    if not allowed:
+                        st.warning(f"You have exceeded the upload limit. Remaining uploads for today: {remaining_uploads}")
+                        return
+
+                    # Hand the batch to the worker processes and remember it across reloads
+                    # The uploads are streamed to disk and then dropped from the uploader
+                    job_id = queue.submit(owner, [(file.name, file) for file in valid_files],
+                                          dict(JOB_OPTIONS, group_bursts=group_bursts), api_key=api_key)
+                    st.session_state['job_id'] = job_id
+                    st.query_params['job'] = job_id
+                    ensure_workers(queue)
+                    st.toast(f"Uploads successful. Remaining uploads for today: {remaining_uploads}")
+                    st.session_state['uploader_key'] += 1
+                    st.rerun()
+
+                except Exception as e:
+                    st.error(f"An error occurred: {e}")
+                    st.error(traceback.format_exc())  # Print detailed error traceback for debugging
+
+        # Follow the current batch; the job id in the URL brings it back after a reload
+        job_id = st.session_state.get('job_id') or st.query_params.get('job')
+        if job_id:
+            show_job(queue, job_id)
 
 if __name__ == '__main__':
     main()
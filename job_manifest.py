@@ -0,0 +1,132 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+# Default location of the manifest database, next to license.txt
+DEFAULT_MANIFEST_PATH = "job_manifest.db"
+
+# Step statuses recorded for every file
+PENDING = 'pending'
+DONE = 'done'
+FAILED = 'failed'
+
+_COLUMNS = ('content_hash', 'name', 'size', 'metadata', 'embed_status', 'embedded_size',
+            'upload_status', 'remote_path', 'remote_size', 'remote_mtime', 'error', 'updated')
+
+
+# Function to hash the original bytes of an uploaded file
+def hash_bytes(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+# Function to hash a file on disk without loading it whole
+def hash_file(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class JobManifest:
+    """Persistent per-file record of generated metadata, embed status and upload status.
+
+    Files are keyed by the hash of their original bytes, so rerunning a batch
+    after a failure finds the work already done for each file regardless of
+    which batch or session did it.
+    """
+
+    def __init__(self, path=DEFAULT_MANIFEST_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            " content_hash TEXT PRIMARY KEY,"
+            " name TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " metadata TEXT,"
+            f" embed_status TEXT NOT NULL DEFAULT '{PENDING}',"
+            " embedded_size INTEGER,"
+            f" upload_status TEXT NOT NULL DEFAULT '{PENDING}',"
+            " remote_path TEXT,"
+            " remote_size INTEGER,"
+            " remote_mtime INTEGER,"
+            " error TEXT,"
+            " updated REAL NOT NULL)"
+        )
+        self.conn.commit()
+
+    def _update(self, content_hash, **fields):
+        fields['updated'] = time.time()
+        assignments = ', '.join(f"{column} = ?" for column in fields)
+        with self.lock:
+            self.conn.execute(f"UPDATE files SET {assignments} WHERE content_hash = ?", (*fields.values(), content_hash))
+            self.conn.commit()
+
+    def get(self, content_hash):
+        with self.lock:
+            row = self.conn.execute("SELECT * FROM files WHERE content_hash = ?", (content_hash,)).fetchone()
+        if row is None:
+            return None
+        record = {column: row[column] for column in _COLUMNS}
+        record['metadata'] = json.loads(record['metadata']) if record['metadata'] else None
+        return record
+
+    def record_file(self, content_hash, name, size):
+        """Register a file, keeping whatever progress an earlier run already made."""
+        with self.lock:
+            self.conn.execute(
+                "INSERT INTO files (content_hash, name, size, updated) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT (content_hash) DO UPDATE SET name = excluded.name",
+                (content_hash, name, size, time.time()),
+            )
+            self.conn.commit()
+        return self.get(content_hash)
+
+    def record_metadata(self, content_hash, metadata):
+        self._update(content_hash, metadata=json.dumps(metadata), error=None)
+
+    def record_embedded(self, content_hash, embedded_size):
+        self._update(content_hash, embed_status=DONE, embedded_size=embedded_size, error=None)
+
+    def record_uploaded(self, content_hash, remote_path, remote_size, remote_mtime):
+        self._update(content_hash, upload_status=DONE, remote_path=remote_path,
+                     remote_size=remote_size, remote_mtime=remote_mtime, error=None)
+
+    def record_failure(self, content_hash, stage, error):
+        fields = {'error': f"{stage}: {error}"}
+        if stage == 'upload':
+            fields['upload_status'] = FAILED
+        elif stage == 'embed':
+            fields['embed_status'] = FAILED
+        self._update(content_hash, **fields)
+
+    def is_uploaded(self, record, remote_attributes):
+        """True if the manifest says the file was uploaded and the remote copy still matches it.
+
+        A remote file with a different size or mtime is a partial or stale
+        upload and is overwritten on the next run.
+        """
+        if record is None or record['upload_status'] != DONE or remote_attributes is None:
+            return False
+        return (remote_attributes.st_size == record['remote_size']
+                and int(remote_attributes.st_mtime or 0) == record['remote_mtime'])
+
+
+# One manifest per database file, shared across Streamlit reruns and sessions
+_manifests = {}
+_manifests_lock = threading.Lock()
+
+
+def get_manifest(path=DEFAULT_MANIFEST_PATH):
+    with _manifests_lock:
+        manifest = _manifests.get(path)
+        if manifest is None:
+            manifest = JobManifest(path)
+            _manifests[path] = manifest
+        return manifest
@@ -0,0 +1,350 @@
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+
+from spooling import spool_upload
+
+# Default location of the queue database and of the spooled uploads, next to license.txt
+DEFAULT_QUEUE_PATH = "job_queue.db"
+DEFAULT_SPOOL_DIR = "job_spool"
+
+# Job statuses
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+# A running job whose worker has not reported for this long is handed to another worker
+STALE_AFTER_SECONDS = 120
+
+# Finished jobs and their spooled files are removed after this long
+KEEP_FINISHED_SECONDS = 24 * 60 * 60
+
+# Jobs no worker has picked up after this long fail, and their API key is dropped
+MAX_QUEUED_SECONDS = 6 * 60 * 60
+
+_JOB_COLUMNS = ('id', 'owner', 'status', 'options', 'total', 'generated', 'embedded', 'report',
+                'output_path', 'error', 'worker', 'created', 'started', 'finished', 'heartbeat')
+
+
+class JobQueue:
+    """Persistent SQLite queue of metadata batches, shared by the Streamlit pages and the workers.
+
+    A page submits a job and polls it; worker processes (job_worker.py) claim
+    queued jobs, report progress and store the result. Uploads are spooled
+    to disk, so a job survives page reloads, closed tabs and worker restarts.
+    Daily upload counts live here too, so every session of a user sees the
+    same quota.
+    """
+
+    def __init__(self, path=DEFAULT_QUEUE_PATH, spool_dir=DEFAULT_SPOOL_DIR):
+        self.path = path
+        self.spool_dir = spool_dir
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY,"
+            " owner TEXT NOT NULL,"
+            f" status TEXT NOT NULL DEFAULT '{QUEUED}',"
+            " options TEXT NOT NULL,"
+            " api_key TEXT,"
+            " total INTEGER NOT NULL,"
+            " generated INTEGER NOT NULL DEFAULT 0,"
+            " embedded INTEGER NOT NULL DEFAULT 0,"
+            " report TEXT,"
+            " output_path TEXT,"
+            " error TEXT,"
+            " worker TEXT,"
+            " created REAL NOT NULL,"
+            " started REAL,"
+            " finished REAL,"
+            " heartbeat REAL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created)")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS job_files ("
+            " job_id TEXT NOT NULL,"
+            " position INTEGER NOT NULL,"
+            " name TEXT NOT NULL,"
+            " path TEXT NOT NULL,"
+            " PRIMARY KEY (job_id, position))"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS quotas ("
+            " owner TEXT NOT NULL,"
+            " day TEXT NOT NULL,"
+            " count INTEGER NOT NULL,"
+            " PRIMARY KEY (owner, day))"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS workers ("
+            " id TEXT PRIMARY KEY,"
+            " pid INTEGER NOT NULL,"
+            " heartbeat REAL NOT NULL)"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS rate_limits ("
+            " owner TEXT PRIMARY KEY,"
+            " tokens REAL NOT NULL,"
+            " updated REAL NOT NULL)"
+        )
+        self.conn.commit()
+
+    def _job(self, row):
+        job = {column: row[column] for column in _JOB_COLUMNS}
+        job['options'] = json.loads(job['options'])
+        job['report'] = json.loads(job['report']) if job['report'] else None
+        return job
+
+    def _update(self, job_id, **fields):
+        assignments = ', '.join(f"{column} = ?" for column in fields)
+        with self.lock:
+            self.conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+            self.conn.commit()
+
+    # Function to count uploads against a daily limit, atomically across sessions and processes
+    def reserve_quota(self, owner, day, count, limit):
+        """Add count to owner's uploads for day if it stays within limit.
+
+        Returns (allowed, remaining); nothing is recorded when the batch does not fit.
+        """
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.conn.execute("SELECT count FROM quotas WHERE owner = ? AND day = ?", (owner, day)).fetchone()
+                used = row['count'] if row else 0
+                if used + count > limit:
+                    self.conn.rollback()
+                    return False, limit - used
+                self.conn.execute(
+                    "INSERT INTO quotas (owner, day, count) VALUES (?, ?, ?)"
+                    " ON CONFLICT (owner, day) DO UPDATE SET count = excluded.count",
+                    (owner, day, used + count),
+                )
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                raise
+        return True, limit - used - count
+
+    # Function to take one request token of owner's per-minute budget, shared by every process
+    def take_token(self, owner, requests_per_minute, capacity):
+        """Take a token from owner's bucket if one is available.
+
+        Returns 0 on success, otherwise the seconds until the next token.
+        """
+        rate = requests_per_minute / 60.0
+        now = time.time()
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.conn.execute("SELECT tokens, updated FROM rate_limits WHERE owner = ?", (owner,)).fetchone()
+                tokens = capacity if row is None else min(capacity, row['tokens'] + max(0.0, now - row['updated']) * rate)
+                wait = 0.0
+                if tokens >= 1:
+                    tokens -= 1
+                else:
+                    wait = (1 - tokens) / rate
+                self.conn.execute(
+                    "INSERT INTO rate_limits (owner, tokens, updated) VALUES (?, ?, ?)"
+                    " ON CONFLICT (owner) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated",
+                    (owner, tokens, now),
+                )
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                raise
+        return wait
+
+    def submit(self, owner, files, options, api_key=None):
+        """Spool (name, file) uploads to disk and queue them as one job; returns the job id.
+
+        Each file is written in chunks straight from its buffer (see
+        spool_upload), so the caller can drop the uploads as soon as this returns.
+        The API key is kept only until the job finishes, fails or expires.
+        """
+        self.expire()
+        job_id = uuid.uuid4().hex
+        job_dir = os.path.join(self.spool_dir, job_id)
+        os.makedirs(job_dir)
+        rows = []
+        for position, (name, file) in enumerate(files):
+            path = os.path.join(job_dir, f"{position:05d}.jpg")
+            spool_upload(file, path)
+            rows.append((job_id, position, name, path))
+
+        with self.lock:
+            self.conn.executemany("INSERT INTO job_files (job_id, position, name, path) VALUES (?, ?, ?, ?)", rows)
+            self.conn.execute(
+                "INSERT INTO jobs (id, owner, options, api_key, total, created) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, owner, json.dumps(options), api_key, len(rows), time.time()),
+            )
+            self.conn.commit()
+        return job_id
+
+    def get(self, job_id):
+        with self.lock:
+            row = self.conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._job(row) if row is not None else None
+
+    def files(self, job_id):
+        """Return the (name, spooled_path) pairs of a job in submission order."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT name, path FROM job_files WHERE job_id = ? ORDER BY position", (job_id,)
+            ).fetchall()
+        return [(row['name'], row['path']) for row in rows]
+
+    def position(self, job_id):
+        """Number of queued jobs submitted before this one."""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT COUNT(*) AS ahead FROM jobs WHERE status = ? AND created < (SELECT created FROM jobs WHERE id = ?)",
+                (QUEUED, job_id),
+            ).fetchone()
+        return row['ahead']
+
+    def claim(self, worker_id):
+        """Mark the oldest queued job as running for worker_id and return it with its API key, or None."""
+        self.expire()
+        now = time.time()
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Jobs of a worker that died mid-batch go back to the queue
+                self.conn.execute(
+                    "UPDATE jobs SET status = ?, worker = NULL WHERE status = ? AND heartbeat < ?",
+                    (QUEUED, RUNNING, now - STALE_AFTER_SECONDS),
+                )
+                row = self.conn.execute(
+                    "SELECT * FROM jobs WHERE status = ? ORDER BY created LIMIT 1", (QUEUED,)
+                ).fetchone()
+                if row is None:
+                    self.conn.commit()
+                    return None
+                self.conn.execute(
+                    "UPDATE jobs SET status = ?, worker = ?, started = ?, heartbeat = ?, generated = 0, embedded = 0"
+                    " WHERE id = ?",
+                    (RUNNING, worker_id, now, now, row['id']),
+                )
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                raise
+        job = self._job(row)
+        job['api_key'] = row['api_key']
+        job['status'] = RUNNING
+        return job
+
+    def update_progress(self, job_id, **counts):
+        """Record generated/embedded counts for the polling page."""
+        self._update(job_id, heartbeat=time.time(), **counts)
+
+    def finish(self, job_id, report, output_path):
+        # The API key is only needed while the job runs
+        self._update(job_id, status=DONE, report=json.dumps(report), output_path=output_path,
+                     api_key=None, finished=time.time(), heartbeat=time.time())
+
+    def fail(self, job_id, error):
+        self._update(job_id, status=FAILED, error=str(error), api_key=None,
+                     finished=time.time(), heartbeat=time.time())
+
+    def expire(self, older_than=MAX_QUEUED_SECONDS):
+        """Fail jobs still queued after older_than seconds, dropping their API keys."""
+        now = time.time()
+        with self.lock:
+            cursor = self.conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, api_key = NULL, finished = ?, heartbeat = ?"
+                " WHERE status = ? AND created < ?",
+                (FAILED, "No worker picked up this batch in time; please submit it again.", now, now,
+                 QUEUED, now - older_than),
+            )
+            self.conn.commit()
+        return cursor.rowcount
+
+    def register_worker(self, worker_id, pid):
+        """Record that a worker is alive, keeping the job it is running from going stale."""
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT INTO workers (id, pid, heartbeat) VALUES (?, ?, ?)"
+                " ON CONFLICT (id) DO UPDATE SET heartbeat = excluded.heartbeat",
+                (worker_id, pid, now),
+            )
+            self.conn.execute("UPDATE jobs SET heartbeat = ? WHERE worker = ? AND status = ?", (now, worker_id, RUNNING))
+            self.conn.commit()
+
+    def unregister_worker(self, worker_id):
+        with self.lock:
+            self.conn.execute("DELETE FROM workers WHERE id = ?", (worker_id,))
+            self.conn.commit()
+
+    def live_workers(self, within=STALE_AFTER_SECONDS):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT COUNT(*) AS live FROM workers WHERE heartbeat >= ?", (time.time() - within,)
+            ).fetchone()
+        return row['live']
+
+    def purge(self, older_than=KEEP_FINISHED_SECONDS):
+        """Delete finished jobs, their spooled files and outputs, and old quota rows."""
+        self.expire()
+        cutoff = time.time() - older_than
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT id FROM jobs WHERE status IN (?, ?) AND finished < ?", (DONE, FAILED, cutoff)
+            ).fetchall()
+            job_ids = [row['id'] for row in rows]
+            for job_id in job_ids:
+                self.conn.execute("DELETE FROM job_files WHERE job_id = ?", (job_id,))
+                self.conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+            self.conn.execute("DELETE FROM workers WHERE heartbeat < ?", (cutoff,))
+            self.conn.execute("DELETE FROM quotas WHERE day < date(?, 'unixepoch', '-7 days')", (cutoff,))
+            self.conn.execute("DELETE FROM rate_limits WHERE updated < ?", (cutoff,))
+            self.conn.commit()
+        for job_id in job_ids:
+            shutil.rmtree(os.path.join(self.spool_dir, job_id), ignore_errors=True)
+        return len(job_ids)
+
+
+class SharedRateLimiter:
+    """Token bucket kept in the queue database, a drop-in for generation.TokenBucket.
+
+    Every worker process and page of the host draws on one per-minute budget
+    per owner (API key hash), instead of each process having its own.
+    """
+
+    def __init__(self, queue, owner, requests_per_minute, capacity=None):
+        self.queue = queue
+        self.owner = owner
+        self.requests_per_minute = requests_per_minute
+        self.capacity = capacity or max(1, requests_per_minute // 6)
+
+    def acquire(self):
+        """Block until a token is available, then take it."""
+        while True:
+            wait = self.queue.take_token(self.owner, self.requests_per_minute, self.capacity)
+            if not wait:
+                return
+            time.sleep(wait)
+
+
+# One queue per database file, shared across Streamlit reruns and sessions
+_queues = {}
+_queues_lock = threading.Lock()
+
+
+def get_queue(path=DEFAULT_QUEUE_PATH, spool_dir=DEFAULT_SPOOL_DIR):
+    with _queues_lock:
+        queue = _queues.get(path)
+        if queue is None:
+            queue = JobQueue(path, spool_dir)
+            _queues[path] = queue
+        return queue
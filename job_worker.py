@@ -0,0 +1,178 @@
+"""Worker processes that run the batches queued by the Streamlit pages.
+
+Usage: python job_worker.py [--processes 2] [--poll-interval 1.0]
+
+Each process claims one queued job at a time from job_queue.db, generates and
+embeds the metadata with the engine, writes the zip next to the spooled
+uploads and records the report. Start as many processes as the host (and the
+API quota) can sustain; every user's jobs share them.
+"""
+import argparse
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import traceback
+import uuid
+import zipfile
+
+import metrics
+from job_queue import DEFAULT_QUEUE_PATH, DEFAULT_SPOOL_DIR, JobQueue, SharedRateLimiter
+from memory_usage import PeakMemory
+from metadata_cache import get_cache
+
+DEFAULT_PROCESSES = 2
+
+# Seconds between heartbeats while a job is running or the worker is idle
+HEARTBEAT_SECONDS = 10
+
+# Seconds between purges of finished jobs
+PURGE_SECONDS = 60 * 60
+
+
+# Function to keep a worker (and its current job) marked alive while it works
+def _heartbeat(queue, worker_id, stop):
+    while not stop.wait(HEARTBEAT_SECONDS):
+        queue.register_worker(worker_id, os.getpid())
+
+
+def run_job(queue, job):
+    """Process one claimed job and store its report and zip in the queue."""
+    # Imported here: the pages import this module only for ensure_workers
+    from engine import PROMPT_SETS, MetadataEngine, build_report, get_model
+
+    job_id = job['id']
+    options = job['options']
+    started = time.time()
+
+    engine = MetadataEngine(
+        get_model(job['api_key'], options['model_name']),
+        prompts=PROMPT_SETS[options['profile']],
+        model_name=options['model_name'],
+        single_call=options['single_call'],
+        cache=get_cache() if options['use_cache'] else None,
+        workers=options['workers'],
+        requests_per_minute=options['requests_per_minute'],
+        # Every worker process running this key's jobs shares one budget
+        limiter=SharedRateLimiter(queue, job['owner'], options['requests_per_minute']),
+        group_bursts=options.get('group_bursts', False),  # Absent from jobs queued by older pages
+    )
+
+    cache_before = engine.cache.stats() if engine.cache else None
+    with metrics.batch_metrics() as batch, PeakMemory() as memory:
+        # The stages read the spooled files directly and embed them in place
+        results = engine.process_batch(
+            queue.files(job_id),
+            on_generate_progress=lambda done, total: queue.update_progress(job_id, generated=done),
+            on_embed_progress=lambda done, total: queue.update_progress(job_id, embedded=done),
+        )
+
+        output_path = os.path.join(queue.spool_dir, job_id, 'processed_images.zip')
+        with metrics.timed('zip'), zipfile.ZipFile(output_path, 'w') as zipf:
+            for result in results:
+                if result.ok:
+                    zipf.write(result.path, result.filename)
+        metrics.record_bytes('zip', os.path.getsize(output_path))
+
+    report = build_report(results, started)
+    report['memory'] = memory.to_dict()
+    report['metrics'] = batch.summary()
+    if cache_before is not None:
+        cache_after = engine.cache.stats()
+        report['cache'] = {
+            'hits': cache_after['hits'] - cache_before['hits'],
+            'misses': cache_after['misses'] - cache_before['misses'],
+            'entries': cache_after['entries'],
+        }
+    queue.finish(job_id, report, output_path)
+
+
+def work(queue_path=DEFAULT_QUEUE_PATH, spool_dir=DEFAULT_SPOOL_DIR, poll_interval=1.0, metrics_dir=None):
+    """Claim and run jobs until interrupted.
+
+    With metrics_dir, this process's Prometheus metrics are written to
+    job_worker_<pid>.prom there after every job.
+    """
+    queue = JobQueue(queue_path, spool_dir)
+    worker_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+    queue.register_worker(worker_id, os.getpid())
+    stop = threading.Event()
+    threading.Thread(target=_heartbeat, args=(queue, worker_id, stop), daemon=True).start()
+    last_purge = 0.0
+    try:
+        while True:
+            if time.time() - last_purge > PURGE_SECONDS:
+                queue.purge()
+                last_purge = time.time()
+
+            job = queue.claim(worker_id)
+            if job is None:
+                time.sleep(poll_interval)
+                continue
+            try:
+                run_job(queue, job)
+            except Exception as e:
+                traceback.print_exc()
+                queue.fail(job['id'], e)
+            if metrics_dir:
+                metrics.write_prometheus(os.path.join(metrics_dir, f"job_worker_{os.getpid()}.prom"))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        queue.unregister_worker(worker_id)
+
+
+# Worker started on demand by a page when no worker is running
+_spawned = None
+_spawn_lock = threading.Lock()
+
+
+def ensure_workers(queue, processes=DEFAULT_PROCESSES):
+    """Start a detached job_worker.py if no worker has reported recently.
+
+    Hosts that run job_worker.py as a service never take this path.
+    """
+    global _spawned
+    with _spawn_lock:
+        if queue.live_workers():
+            return
+        if _spawned is not None and _spawned.poll() is None:
+            return  # Started by an earlier rerun and still registering
+        _spawned = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), '--processes', str(processes),
+             '--queue', queue.path, '--spool-dir', queue.spool_dir],
+            start_new_session=True,
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--processes', type=int, default=DEFAULT_PROCESSES, help="jobs processed concurrently")
+    parser.add_argument('--poll-interval', type=float, default=1.0, help="seconds between checks of an empty queue")
+    parser.add_argument('--queue', default=DEFAULT_QUEUE_PATH)
+    parser.add_argument('--spool-dir', default=DEFAULT_SPOOL_DIR)
+    parser.add_argument('--metrics-dir', help="write each process's Prometheus metrics here (textfile collector)")
+    args = parser.parse_args()
+
+    if args.metrics_dir:
+        os.makedirs(args.metrics_dir, exist_ok=True)
+    processes = [
+        multiprocessing.Process(target=work, args=(args.queue, args.spool_dir, args.poll_interval, args.metrics_dir))
+        for _ in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.join()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,198 @@
+import itertools
+import re
+import unicodedata
+import zlib
+from functools import lru_cache
+
+import numpy as np
+
+# Patterns used on every generated title and keyword list, compiled once
+WORD_PATTERN = re.compile(r'\w+')
+DISALLOWED_TAG_CHARS = re.compile(r'[^\w\s,]')
+FILENAME_UNSAFE_CHARS = re.compile(r'[\\/:*?"<>|]')
+
+# Stock sites accept up to 49 keywords; the model is asked to put the 5 most relevant first
+MAX_KEYWORDS = 49
+
+# Words ignored when comparing titles
+TITLE_STOPWORDS = frozenset(
+    "a an and at by for from in into of on or over the to under with".split()
+)
+
+# MinHash settings for the near-duplicate pass: 16 bands of 5 rows make pairs above
+# ~0.7 Jaccard candidates almost surely while unrelated images rarely collide
+NUM_BANDS = 16
+ROWS_PER_BAND = 5
+NUM_PERMUTATIONS = NUM_BANDS * ROWS_PER_BAND
+DEFAULT_SIMILARITY_THRESHOLD = 0.8
+_MERSENNE_PRIME = (1 << 61) - 1
+
+# Candidates whose estimated similarity falls this far below the threshold are not checked exactly
+_ESTIMATE_MARGIN = 0.15
+
+# Permutations applied per step, bounding the (tokens x permutations) scratch array
+_PERMUTATION_CHUNK = 16
+
+
+# Function to strip accents and non-ASCII characters
+def fold_ascii(text):
+    return unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode('utf-8')
+
+
+# Title words repeat heavily across a batch, so each distinct word is folded only once
+@lru_cache(maxsize=65536)
+def _fold_word(word):
+    return fold_ascii(word.lower())
+
+
+# Function to remove duplicates while keeping the first occurrence of each item in place
+def dedupe(items):
+    return list(dict.fromkeys(items))
+
+
+# Function to clean comma-separated tags, keeping the model's order (manual page)
+def filter_tags(tags_text, limit=MAX_KEYWORDS):
+    # Filter out undesirable characters from the generated tags
+    filtered_tags = DISALLOWED_TAG_CHARS.sub('', tags_text)
+
+    # Drop repeated keywords, then trim to the limit
+    keywords = {}
+    for keyword in filtered_tags.split(','):
+        keywords.setdefault(keyword.strip().lower(), keyword)
+    keywords.pop('', None)
+    return ','.join(list(keywords.values())[:limit]).strip()
+
+
+# Function to reduce tags to unique lowercase ASCII single words, keeping the model's relevance order (SFTP page)
+def single_word_tags(tags_text, limit=MAX_KEYWORDS):
+    # Folding the whole string once is cheaper than a cached call per word
+    words = dedupe(WORD_PATTERN.findall(fold_ascii(tags_text.lower())))
+    return ','.join(words[:limit])
+
+
+# Function to split a title or keyword string into the set of words compared across a batch
+def title_tokens(title):
+    return {_fold_word(word) for word in WORD_PATTERN.findall(title)} - TITLE_STOPWORDS
+
+
+def keyword_tokens(tags):
+    # Tags are already cleaned by filter_tags or single_word_tags, so lowercasing is enough
+    tokens = set(map(str.strip, tags.lower().split(',')))
+    tokens.discard('')
+    return tokens
+
+
+# Function to compute MinHash signatures of many token sets at once
+def minhash_signatures(token_sets, num_permutations=NUM_PERMUTATIONS, seed=1):
+    """Return an (len(token_sets), num_permutations) array of MinHash values.
+
+    Every distinct token of the batch is hashed once, the permutations are
+    applied in vectorized chunks and the per-set minimum is taken with
+    reduceat. Empty sets get a row of maximum values.
+    """
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, _MERSENNE_PRIME, num_permutations, dtype=np.uint64)
+    b = rng.integers(0, _MERSENNE_PRIME, num_permutations, dtype=np.uint64)
+
+    signatures = np.full((len(token_sets), num_permutations), np.iinfo(np.uint32).max, dtype=np.uint32)
+    lengths = np.fromiter(map(len, token_sets), dtype=np.int64, count=len(token_sets))
+    if not lengths.sum():
+        return signatures
+
+    vocabulary = list(set().union(*token_sets))
+    token_ids = {token: token_id for token_id, token in enumerate(vocabulary)}
+    ids = np.fromiter(map(token_ids.__getitem__, itertools.chain.from_iterable(token_sets)),
+                      dtype=np.int64, count=int(lengths.sum()))
+    hashes = np.fromiter((zlib.crc32(token.encode('utf-8')) for token in vocabulary), dtype=np.uint64,
+                         count=len(vocabulary))
+
+    # Permute the distinct tokens only; 32-bit hashes times 61-bit multipliers wrap in
+    # uint64, which is fine for a hash family, and the low 32 bits are kept
+    permuted = ((hashes[:, None] * a[None, :] + b[None, :]) % np.uint64(_MERSENNE_PRIME)).astype(np.uint32)
+
+    non_empty = lengths > 0
+    offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))[non_empty]
+    for start in range(0, num_permutations, _PERMUTATION_CHUNK):
+        end = min(start + _PERMUTATION_CHUNK, num_permutations)
+        signatures[non_empty, start:end] = np.minimum.reduceat(permuted[ids, start:end], offsets, axis=0)
+    return signatures
+
+
+# Function to measure how much two token sets overlap
+def jaccard(first, second):
+    if not first and not second:
+        return 0.0
+    return len(first & second) / len(first | second)
+
+
+# Function to list the (i, j) index pairs, i < j, that share a key
+def _colliding_pairs(keys, indices):
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    starts = np.flatnonzero(np.concatenate(([True], sorted_keys[1:] != sorted_keys[:-1])))
+    sizes = np.diff(np.append(starts, len(keys)))
+    # Most colliding buckets hold exactly two sets, handled in one vectorized step
+    two = starts[sizes == 2]
+    pairs = [np.sort(np.stack((indices[order[two]], indices[order[two + 1]]), axis=1), axis=1)]
+    for start, size in zip(starts[sizes > 2], sizes[sizes > 2]):
+        members = np.sort(indices[order[start:start + size]])
+        first, second = np.triu_indices(size, 1)
+        pairs.append(np.stack((members[first], members[second]), axis=1))
+    return pairs
+
+
+def similar_pairs(token_sets, threshold=DEFAULT_SIMILARITY_THRESHOLD):
+    """Find (i, j, similarity) pairs, i < j, whose Jaccard similarity is at least threshold.
+
+    Candidates come from MinHash locality-sensitive hashing (sets that agree
+    on every row of at least one band), are filtered by their estimated
+    similarity and then checked exactly, so no false positives are returned
+    and the cost grows with the batch size, not its square.
+    """
+    indices = np.array([index for index, tokens in enumerate(token_sets) if tokens], dtype=np.int64)
+    if len(indices) < 2:
+        return []
+    signatures = minhash_signatures([token_sets[index] for index in indices])
+
+    # Collapse the rows of every band into one key
+    rng = np.random.default_rng(2)
+    multipliers = rng.integers(1, np.iinfo(np.int64).max, ROWS_PER_BAND, dtype=np.uint64) | np.uint64(1)
+    signatures_wide = signatures.astype(np.uint64)
+    candidates = []
+    for band in range(NUM_BANDS):
+        rows = signatures_wide[:, band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND]
+        keys = (rows * multipliers).sum(axis=1)
+        candidates.extend(_colliding_pairs(keys, np.arange(len(indices))))
+    if not candidates:
+        return []
+    candidates = np.unique(np.concatenate(candidates), axis=0)
+
+    # The share of equal MinHash values estimates the Jaccard similarity
+    estimates = (signatures[candidates[:, 0]] == signatures[candidates[:, 1]]).mean(axis=1)
+    candidates = candidates[estimates >= threshold - _ESTIMATE_MARGIN]
+
+    pairs = []
+    for first, second in indices[candidates].tolist():
+        similarity = jaccard(token_sets[first], token_sets[second])
+        if similarity >= threshold:
+            pairs.append((first, second, similarity))
+    return pairs
+
+
+def find_near_duplicates(metadata_list, threshold=DEFAULT_SIMILARITY_THRESHOLD):
+    """Flag images whose title or keyword set nearly repeats an earlier image of the batch.
+
+    metadata_list holds metadata dicts (or None for failed images). Returns
+    {index: (earlier_index, field, similarity)} where field is 'Title' or
+    'Tags'; each image points at the first earlier image it resembles.
+    """
+    titles = [title_tokens(metadata['Title']) if metadata else set() for metadata in metadata_list]
+    tags = [keyword_tokens(metadata['Tags']) if metadata else set() for metadata in metadata_list]
+
+    duplicates = {}
+    for field, token_sets in (('Title', titles), ('Tags', tags)):
+        for first, second, similarity in similar_pairs(token_sets, threshold):
+            current = duplicates.get(second)
+            if current is None or first < current[0]:
+                duplicates[second] = (first, field, similarity)
+    return duplicates
@@ -0,0 +1,91 @@
+import os
+import threading
+from datetime import datetime
+
+LICENSE_FILE = "license.txt"
+LOCK_FILE = "lock.txt"
+
+
+class WatchedFile:
+    """Parsed contents of a small text file, re-read only when its mtime or size changes.
+
+    Streamlit reruns the page on every interaction; with this the rerun costs
+    one stat() instead of an open, read and parse. A missing file reads as None.
+    """
+
+    def __init__(self, path, parse):
+        self.path = path
+        self.parse = parse
+        self.lock = threading.Lock()
+        self.stamp = None
+        self.value = None
+
+    def _stamp(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def read(self):
+        stamp = self._stamp()
+        with self.lock:
+            if stamp != self.stamp:
+                if stamp is None:
+                    self.value = None
+                else:
+                    with open(self.path, 'r') as file:
+                        self.value = self.parse(file.read())
+                self.stamp = stamp
+            return self.value
+
+    def write(self, text):
+        with self.lock:
+            with open(self.path, 'w') as file:
+                file.write(text)
+            self.value = self.parse(text)
+            self.stamp = self._stamp()
+
+
+# Watched files shared by every session and rerun in this process
+_files = {}
+_files_lock = threading.Lock()
+
+
+def get_watched_file(path, parse):
+    with _files_lock:
+        watched = _files.get(path)
+        if watched is None:
+            watched = WatchedFile(path, parse)
+            _files[path] = watched
+        return watched
+
+
+# Function to parse the license start date written on activation
+def _parse_start_date(text):
+    return datetime.fromisoformat(text.strip())
+
+
+# Function to read the license start date, or None before activation
+def license_start_date(path=LICENSE_FILE):
+    return get_watched_file(path, _parse_start_date).read()
+
+
+# Function to record the license activation date
+def save_license_start_date(start_date, path=LICENSE_FILE):
+    get_watched_file(path, _parse_start_date).write(start_date.isoformat())
+
+
+# Function to parse the lock file: held while it says "logged_in"
+def _parse_lock(text):
+    return text.strip() == "logged_in"
+
+
+# Function to check if the single-device lock is held
+def check_lock(path=LOCK_FILE):
+    return bool(get_watched_file(path, _parse_lock).read())
+
+
+# Function to set the single-device lock ("logged_in") or release it ("")
+def set_lock(status, path=LOCK_FILE):
+    get_watched_file(path, _parse_lock).write(status)
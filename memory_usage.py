@@ -0,0 +1,85 @@
+import os
+import sys
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+# Function to read the resident set size of this process, in bytes
+def current_rss():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return None
+
+
+# Function to read the peak resident set size of this process, in bytes
+def peak_rss():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    return usage if sys.platform == 'darwin' else usage * 1024
+
+
+# Function to reset the kernel's peak RSS counter to the current RSS (Linux only)
+def reset_peak_rss():
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+# Function to format a byte count for display
+def format_size(size):
+    if size is None:
+        return "unknown"
+    for unit in ('B', 'KB', 'MB'):
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+
+
+class PeakMemory:
+    """Measure the peak RSS of this process over a block, e.g. one batch.
+
+    On Linux the kernel's high-water mark is reset on entry, so the peak
+    belongs to the block alone. The reset applies to the whole process: use
+    it where one batch runs at a time (the job workers, the CLI). With
+    reset=False, as on the Streamlit pages where concurrent sessions would
+    reset each other's mark, and on other platforms, the process-lifetime
+    peak is reported and `lifetime` is True. Memory of the embedding pool's
+    worker processes is not included.
+    """
+
+    def __init__(self, reset=True):
+        self.reset = reset
+
+    def __enter__(self):
+        self.start_rss = current_rss()
+        self.lifetime = not (self.reset and reset_peak_rss())
+        self.peak_rss = None
+        return self
+
+    def __exit__(self, *exc_info):
+        self.peak_rss = peak_rss()
+
+    def to_dict(self):
+        return {
+            'start_rss_bytes': self.start_rss,
+            'peak_rss_bytes': self.peak_rss,
+            'lifetime_peak': self.lifetime,
+        }
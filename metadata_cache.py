@@ -0,0 +1,153 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+import metrics
+
+# Default location of the cache database, next to license.txt
+DEFAULT_CACHE_PATH = "metadata_cache.db"
+
+# Eviction limits: number of entries and total size of the stored metadata
+DEFAULT_MAX_ENTRIES = 50000
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+# Once a limit is exceeded, entries are evicted down to this share of it, so evictions are rare
+EVICT_TO = 0.9
+
+
+class MetadataCache:
+    """Persistent SQLite cache of generated metadata with LRU eviction.
+
+    Entries are keyed by the decoded pixels of the image plus the prompt and
+    model name, so the same photo re-uploaded under another filename or with
+    different EXIF data still hits, while a prompt or model change misses.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS metadata ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS metadata_last_used ON metadata (last_used)")
+        self.conn.commit()
+        self._count_entries()
+
+    def _count_entries(self):
+        # A full scan; afterwards the totals are kept up to date by put() and only re-read on eviction.
+        # Other processes sharing the file are not seen until then, which only shifts when eviction runs
+        self.entries, self.total_bytes = self.conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM metadata"
+        ).fetchone()
+
+    @staticmethod
+    def make_key(img, prompt, model_name):
+        """Hash an image together with the prompt and model name.
+
+        img is either a PIL image, hashed by its decoded pixels, or an inline
+        part from prepare_model_image, hashed by its JPEG data. That data is
+        re-encoded from the decoded pixels, so identical pixels give identical keys.
+        """
+        digest = hashlib.sha256()
+        digest.update(f"{model_name}\0{prompt}\0".encode('utf-8'))
+        if isinstance(img, dict):
+            digest.update(f"{img['mime_type']}\0".encode('utf-8'))
+            digest.update(img['data'])
+        else:
+            digest.update(f"{img.mode}\0{img.size}\0".encode('utf-8'))
+            digest.update(img.tobytes())
+        return digest.hexdigest()
+
+    def get(self, key):
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM metadata WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.conn.execute("UPDATE metadata SET last_used = ? WHERE key = ?", (time.time(), key))
+                self.conn.commit()
+        metrics.inc(metrics.CACHE_LOOKUPS, result='miss' if row is None else 'hit')
+        return json.loads(row[0]) if row is not None else None
+
+    def put(self, key, metadata):
+        value = json.dumps(metadata)
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO metadata (key, value, size, last_used) VALUES (?, ?, ?, ?)",
+                (key, value, len(value), time.time()),
+            )
+            # A replaced key is counted twice; the overestimate is corrected on eviction
+            self.entries += 1
+            self.total_bytes += len(value)
+            self._evict()
+            self.conn.commit()
+
+    def _evict(self):
+        # Drop least recently used entries once either limit is exceeded, down to EVICT_TO of both
+        if self.entries <= self.max_entries and self.total_bytes <= self.max_bytes:
+            return
+        self._count_entries()
+        if self.entries <= self.max_entries and self.total_bytes <= self.max_bytes:
+            return
+        drop = max(0, self.entries - int(self.max_entries * EVICT_TO))
+        excess = self.total_bytes - int(self.max_bytes * EVICT_TO)
+        if excess > 0:
+            # Walk the oldest entries through the last_used index only as far as needed
+            freed = 0
+            for position, (size,) in enumerate(self.conn.execute("SELECT size FROM metadata ORDER BY last_used"), 1):
+                freed += size
+                if freed >= excess:
+                    drop = max(drop, position)
+                    break
+        self.conn.execute(
+            "DELETE FROM metadata WHERE key IN (SELECT key FROM metadata ORDER BY last_used LIMIT ?)", (drop,)
+        )
+        self._count_entries()
+
+    def stats(self):
+        with self.lock:
+            self._count_entries()
+            return {'hits': self.hits, 'misses': self.misses, 'entries': self.entries}
+
+    def reset_counters(self):
+        with self.lock:
+            self.hits = 0
+            self.misses = 0
+
+    def cached(self, generate_fn, prompt, model_name):
+        """Wrap generate_fn(model, img) so results are looked up before calling the model."""
+        def generate(model, img):
+            key = self.make_key(img, prompt, model_name)
+            metadata = self.get(key)
+            if metadata is None:
+                metadata = generate_fn(model, img)
+                self.put(key, metadata)
+            return metadata
+        return generate
+
+
+# One cache per database file, shared across Streamlit reruns and sessions
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(path=DEFAULT_CACHE_PATH):
+    with _caches_lock:
+        cache = _caches.get(path)
+        if cache is None:
+            cache = MetadataCache(path)
+            _caches[path] = cache
+        return cache
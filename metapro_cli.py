@@ -0,0 +1,248 @@
+"""Headless MetaPro batch runner: caption, embed and deliver a folder of JPEGs without Streamlit.
+
+Examples:
+  python metapro_cli.py photos/ --output-dir processed/ --report report.json
+  python metapro_cli.py photos/ --zip processed.zip --workers 16 --rpm 1000
+  python metapro_cli.py incoming/ --watch --sftp --profile sftp --remote-dir /uploads
+
+The Gemini API key is read from --api-key or the GOOGLE_API_KEY environment
+variable, the SFTP password from --sftp-password or SFTP_PASSWORD.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import zipfile
+
+from engine import (DEFAULT_MODEL_NAME, PROMPT_SETS, MetadataEngine, build_report, get_model, title_filename,
+                    unique_filename)
+from generation import DEFAULT_REQUESTS_PER_MINUTE, DEFAULT_WORKERS
+from job_manifest import get_manifest
+from memory_usage import PeakMemory, format_size
+from metadata_cache import get_cache
+from metrics import batch_metrics, profile_batch, write_prometheus
+from perceptual_hash import DEFAULT_BURST_THRESHOLD
+from sftp_transfer import DEFAULT_CONNECTIONS, SFTPTransferPool, format_throughput
+
+JPEG_EXTENSIONS = ('.jpg', '.jpeg')
+
+# Files still being copied into a watched folder are left alone until they are this old
+SETTLE_SECONDS = 2.0
+
+
+# Function to list the JPEGs of a directory in a stable order
+def find_images(directory):
+    paths = []
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if name.lower().endswith(JPEG_EXTENSIONS) and os.path.isfile(path):
+            paths.append(path)
+    return paths
+
+
+# Function to split a list into chunks of `size`
+def chunked(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0], epilog="\n".join(__doc__.splitlines()[2:]),
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('input', help="directory of JPEG files")
+    parser.add_argument('--watch', action='store_true', help="keep running and process new files as they appear")
+    parser.add_argument('--interval', type=float, default=10.0, help="seconds between scans in --watch mode")
+    parser.add_argument('--profile', choices=sorted(PROMPT_SETS), default='manual', help="prompts and tag formatting")
+    parser.add_argument('--api-key', default=os.environ.get('GOOGLE_API_KEY'))
+    parser.add_argument('--model', default=DEFAULT_MODEL_NAME)
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help="images captioned concurrently")
+    parser.add_argument('--rpm', type=int, default=DEFAULT_REQUESTS_PER_MINUTE, help="API requests per minute")
+    parser.add_argument('--two-call', action='store_true', help="ask for title and tags in separate requests")
+    parser.add_argument('--no-cache', action='store_true', help="always call the model, even for known images")
+    parser.add_argument('--group-bursts', action='store_true',
+                        help="caption near-identical frames once and number their titles")
+    parser.add_argument('--burst-threshold', type=int, default=DEFAULT_BURST_THRESHOLD,
+                        help="max differing hash bits (of 64) between frames of a burst")
+    parser.add_argument('--batch-size', type=int, default=100, help="images held in memory at a time")
+    parser.add_argument('--output-dir', help="write the embedded images here, named after their titles")
+    parser.add_argument('--zip', help="write the embedded images into this zip file")
+    parser.add_argument('--sftp', action='store_true', help="upload the embedded images over SFTP")
+    parser.add_argument('--sftp-host', default="sftp.contributor.adobestock.com")
+    parser.add_argument('--sftp-port', type=int, default=22)
+    parser.add_argument('--sftp-username', default=os.environ.get('SFTP_USERNAME'))
+    parser.add_argument('--sftp-password', default=os.environ.get('SFTP_PASSWORD'))
+    parser.add_argument('--remote-dir', default=".")
+    parser.add_argument('--connections', type=int, default=DEFAULT_CONNECTIONS, help="parallel SFTP channels")
+    parser.add_argument('--report', default="metapro_report.json", help="JSON report path")
+    parser.add_argument('--metrics-file', help="write Prometheus metrics here after every batch (textfile collector)")
+    parser.add_argument('--cprofile', help="profile the first batch with cProfile and dump the stats here")
+    args = parser.parse_args(argv)
+
+    if not args.api_key:
+        parser.error("an API key is required (--api-key or GOOGLE_API_KEY)")
+    if not (args.output_dir or args.zip or args.sftp):
+        parser.error("choose --output-dir and/or --zip, or --sftp")
+    if args.sftp and (args.output_dir or args.zip):
+        parser.error("--sftp cannot be combined with --output-dir or --zip")
+    if args.sftp and not (args.sftp_username and args.sftp_password):
+        parser.error("--sftp needs --sftp-username and --sftp-password (or SFTP_USERNAME / SFTP_PASSWORD)")
+    return args
+
+
+class BatchRunner:
+    """Runs the engine over lists of files and delivers the results to the configured outputs."""
+
+    def __init__(self, args):
+        self.args = args
+        self.engine = MetadataEngine(
+            get_model(args.api_key, args.model),
+            prompts=PROMPT_SETS[args.profile],
+            model_name=args.model,
+            single_call=not args.two_call,
+            cache=None if args.no_cache else get_cache(),
+            workers=args.workers,
+            requests_per_minute=args.rpm,
+            limiter_key=args.api_key,
+            group_bursts=args.group_bursts,
+            burst_threshold=args.burst_threshold,
+        )
+        self.results = []
+        self.started = time.time()
+        self.batches = []
+        # Names already taken in the output directory and the zip, so later batches and scans never clash
+        self.used_filenames = set()
+        if args.output_dir:
+            os.makedirs(args.output_dir, exist_ok=True)
+            self.used_filenames.update(name.lower() for name in os.listdir(args.output_dir))
+        self.zipf = None
+        if args.zip:
+            # Opened once for the whole run; the central directory is written on close()
+            self.zipf = zipfile.ZipFile(args.zip, 'a')
+            self.used_filenames.update(name.lower() for name in self.zipf.namelist())
+        self.pool = None
+        if args.sftp:
+            self.pool = SFTPTransferPool(args.sftp_host, args.sftp_port, args.sftp_username, args.sftp_password,
+                                         connections=args.connections)
+
+    def log(self, message):
+        print(message, file=sys.stderr, flush=True)
+
+    def process(self, paths):
+        # Only the first batch is profiled, so the profile isn't diluted by idle --watch scans
+        profile_path = self.args.cprofile if not self.batches else None
+        with batch_metrics() as batch, PeakMemory() as memory, profile_batch(profile_path):
+            self._process(paths)
+        self.batches.append({'images': len(paths), 'memory': memory.to_dict(), 'metrics': batch.summary()})
+        self.log(f"  peak memory {format_size(memory.peak_rss)}")
+        if self.args.metrics_file:
+            write_prometheus(self.args.metrics_file)
+
+    def _process(self, paths):
+        args = self.args
+        if self.pool is not None:
+            # Files are streamed and only a few are held in memory, so no chunking is needed
+            results = self.engine.process_sftp(
+                [(os.path.basename(path), path) for path in paths],
+                self.pool,
+                args.remote_dir,
+                get_manifest(),
+                upload_workers=args.connections,
+            )
+            for result in results:
+                if not result.ok:
+                    self.log(f"  failed {result.name} ({result.stage}): {result.error}")
+                elif result.transfer is not None:
+                    self.log(f"  uploaded {result.name}: {format_size(result.transfer.size)} in "
+                             f"{result.transfer.seconds:.2f}s ({format_throughput(result.transfer.throughput)})")
+            self.log(f"  uploaded at {format_throughput(self.pool.stats.throughput)}")
+            self.results.extend(results)
+            return
+
+        for chunk in chunked(paths, args.batch_size):
+            sources = []
+            for path in chunk:
+                with open(path, 'rb') as f:
+                    sources.append((os.path.basename(path), f.read()))
+            results = self.engine.process_batch(
+                sources,
+                on_generate_progress=lambda done, total: self.log(f"  generated {done}/{total}"),
+            )
+            self.deliver(results)
+            self.results.extend(results)
+
+    def deliver(self, results):
+        args = self.args
+        for result in results:
+            if not result.ok:
+                self.log(f"  failed {result.name} ({result.stage}): {result.error}")
+                continue
+            if result.duplicate_of:
+                self.log(f"  {result.name} has a title or keywords similar to {result.duplicate_of}")
+            # Numbered again from the title, across every batch of the run and the existing outputs
+            result.filename = unique_filename(title_filename(result.metadata), self.used_filenames)
+            if args.output_dir:
+                with open(os.path.join(args.output_dir, result.filename), 'wb') as f:
+                    f.write(result.data)
+            if self.zipf is not None:
+                self.zipf.writestr(result.filename, result.data)
+            result.data = None
+
+    def write_report(self):
+        report = build_report(self.results, self.started)
+        report['batches'] = self.batches
+        with open(self.args.report, 'w') as f:
+            json.dump(report, f, indent=2)
+        self.log(f"{report['succeeded']} processed, {report['skipped']} skipped, {report['failed']} failed "
+                 f"({report['images_per_second']:.2f} images/sec); report written to {self.args.report}")
+        return report
+
+    def close(self):
+        if self.zipf is not None:
+            self.zipf.close()
+        if self.pool is not None:
+            self.pool.close()
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    runner = BatchRunner(args)
+    seen = set()
+    report = None
+    try:
+        while True:
+            now = time.time()
+            pending = []
+            for path in find_images(args.input):
+                stat = os.stat(path)
+                key = (path, stat.st_size, stat.st_mtime)
+                if key in seen:
+                    continue
+                if args.watch and now - stat.st_mtime < SETTLE_SECONDS:
+                    continue
+                seen.add(key)
+                pending.append(path)
+
+            if pending:
+                runner.log(f"Processing {len(pending)} images from {args.input}")
+                runner.process(pending)
+                report = runner.write_report()
+
+            if not args.watch:
+                break
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        runner.close()
+
+    if not args.watch and not seen:
+        runner.log(f"No JPEG files found in {args.input}")
+        return 1
+    if report is not None and report['failed']:
+        return 2
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
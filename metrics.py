@@ -0,0 +1,247 @@
+import bisect
+import cProfile
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Latency buckets in seconds, from an in-memory IPTC splice up to a retried Gemini call
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Metric names, all labelled by stage unless noted
+STAGE_SECONDS = 'metapro_stage_seconds'
+STAGE_BYTES = 'metapro_stage_bytes_total'
+STAGE_ERRORS = 'metapro_stage_errors_total'
+API_RETRIES = 'metapro_api_retries_total'
+API_ERRORS = 'metapro_api_errors_total'  # labelled by code
+CACHE_LOOKUPS = 'metapro_cache_lookups_total'  # labelled by result
+SFTP_RETRIES = 'metapro_sftp_retries_total'
+SFTP_RECONNECTS = 'metapro_sftp_reconnects_total'
+BURST_FRAMES_REUSED = 'metapro_burst_frames_reused_total'
+
+_HELP = {
+    STAGE_SECONDS: "Latency of one call of a pipeline stage.",
+    STAGE_BYTES: "Bytes produced or moved by a pipeline stage.",
+    STAGE_ERRORS: "Calls of a pipeline stage that raised.",
+    API_RETRIES: "Gemini requests retried after a rate limit or server error.",
+    API_ERRORS: "Gemini requests that failed, by status code or error type.",
+    CACHE_LOOKUPS: "Metadata cache lookups, by hit or miss.",
+    SFTP_RETRIES: "SFTP upload attempts beyond the first.",
+    SFTP_RECONNECTS: "SFTP connections re-established after a drop.",
+    BURST_FRAMES_REUSED: "Burst frames titled from another frame's metadata instead of a model call.",
+}
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram, optionally keeping raw samples for exact percentiles."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, keep_samples=False):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.samples = [] if keep_samples else None
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+        if self.samples is not None:
+            self.samples.append(value)
+
+    def percentile(self, fraction):
+        """Nearest-rank percentile; estimated as a bucket bound when samples are not kept."""
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(fraction * self.count))
+        if self.samples is not None:
+            return sorted(self.samples)[rank - 1]
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.max
+
+
+# Function to format a label set the way Prometheus expects
+def _labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in pairs) + '}'
+
+
+class Metrics:
+    """Counters and histograms keyed by metric name and label set."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, keep_samples=False):
+        self.buckets = buckets
+        self.keep_samples = keep_samples
+        self.counters = {}
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(self.buckets, self.keep_samples)
+            histogram.observe(value)
+
+    def to_prometheus(self):
+        """Render every metric in the Prometheus text exposition format."""
+        lines = []
+        with self.lock:
+            for name in sorted({key[0] for key in self.counters}):
+                lines.append(f"# HELP {name} {_HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} counter")
+                for (metric, labels), value in sorted(self.counters.items()):
+                    if metric == name:
+                        lines.append(f"{name}{_labels(labels)} {value}")
+            for name in sorted({key[0] for key in self.histograms}):
+                lines.append(f"# HELP {name} {_HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} histogram")
+                for (metric, labels), histogram in sorted(self.histograms.items()):
+                    if metric != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_labels(labels, [('le', bound)])} {cumulative}")
+                    lines.append(f"{name}_bucket{_labels(labels, [('le', '+Inf')])} {histogram.count}")
+                    lines.append(f"{name}_sum{_labels(labels)} {histogram.sum}")
+                    lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+        return '\n'.join(lines) + '\n'
+
+    def summary(self):
+        """Per-stage latency, error and byte totals plus every other counter, as a JSON-ready dict."""
+        stages = {}
+        counters = {}
+        with self.lock:
+            for (name, labels), histogram in self.histograms.items():
+                if name != STAGE_SECONDS:
+                    continue
+                stage = dict(labels)['stage']
+                stages[stage] = {
+                    'calls': histogram.count,
+                    'total_seconds': histogram.sum,
+                    'mean_ms': histogram.sum / histogram.count * 1000 if histogram.count else 0.0,
+                    'p50_ms': histogram.percentile(0.50) * 1000,
+                    'p95_ms': histogram.percentile(0.95) * 1000,
+                    'max_ms': histogram.max * 1000,
+                    'errors': 0,
+                    'bytes': 0,
+                }
+            for (name, labels), value in self.counters.items():
+                stage = dict(labels).get('stage')
+                if name == STAGE_ERRORS and stage in stages:
+                    stages[stage]['errors'] = value
+                elif name == STAGE_BYTES and stage in stages:
+                    stages[stage]['bytes'] = value
+                else:
+                    counters[f"{name}{_labels(labels)}"] = value
+        return {'stages': stages, 'counters': counters}
+
+
+# Process-wide metrics, exported to Prometheus, plus the collectors of batches in progress
+METRICS = Metrics()
+_batches = []
+_batches_lock = threading.Lock()
+
+
+def inc(name, amount=1, **labels):
+    METRICS.inc(name, amount, **labels)
+    with _batches_lock:
+        batches = list(_batches)
+    for batch in batches:
+        batch.inc(name, amount, **labels)
+
+
+def observe(name, value, **labels):
+    METRICS.observe(name, value, **labels)
+    with _batches_lock:
+        batches = list(_batches)
+    for batch in batches:
+        batch.observe(name, value, **labels)
+
+
+def record_bytes(stage, size):
+    inc(STAGE_BYTES, size, stage=stage)
+
+
+@contextmanager
+def timed(stage):
+    """Record the latency of the block under `stage`, and an error if it raises."""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        inc(STAGE_ERRORS, stage=stage)
+        raise
+    finally:
+        observe(STAGE_SECONDS, time.perf_counter() - start, stage=stage)
+
+
+def instrument(stage, fn, size=None):
+    """Wrap fn so every call is timed under `stage`; size(result) is recorded as bytes."""
+    def wrapper(*args, **kwargs):
+        with timed(stage):
+            result = fn(*args, **kwargs)
+        if size is not None:
+            record_bytes(stage, size(result))
+        return result
+    return wrapper
+
+
+@contextmanager
+def batch_metrics():
+    """Collect everything recorded in this process during the block into a fresh Metrics.
+
+    Percentiles in its summary() are exact. Batches running at the same time
+    in one process (two Streamlit sessions) see each other's calls.
+    """
+    batch = Metrics(keep_samples=True)
+    with _batches_lock:
+        _batches.append(batch)
+    try:
+        yield batch
+    finally:
+        with _batches_lock:
+            _batches.remove(batch)
+
+
+@contextmanager
+def profile_batch(path):
+    """Run the block under cProfile and dump the stats to path; does nothing when path is empty.
+
+    Only the calling thread is profiled, so time spent in the generation and
+    upload threads shows up as waits. Inspect with `python -m pstats path`.
+    """
+    if not path:
+        yield None
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
+
+
+# Function to write the process-wide metrics for the node_exporter textfile collector
+def write_prometheus(path, metrics=METRICS):
+    temp_path = f"{path}.part"
+    with open(temp_path, 'w') as f:
+        f.write(metrics.to_prometheus())
+    os.replace(temp_path, path)
@@ -0,0 +1,125 @@
+import io
+
+import numpy as np
+from PIL import Image
+
+# Side of the grayscale thumbnail the hashes are computed from
+HASH_IMAGE_SIZE = 32
+
+# Frames whose pHash and dHash both differ in at most this many of 64 bits are one burst
+DEFAULT_BURST_THRESHOLD = 10
+
+# Rows of the pairwise distance matrix computed per step, bounding its memory
+_DISTANCE_BLOCK = 1024
+
+
+# Orthonormal DCT-II matrix, so a 2-D DCT of X is D @ X @ D.T
+def _dct_matrix(size):
+    k = np.arange(size)[:, None]
+    n = np.arange(size)[None, :]
+    matrix = np.cos(np.pi * (2 * n + 1) * k / (2 * size)) * np.sqrt(2.0 / size)
+    matrix[0] /= np.sqrt(2.0)
+    return matrix.astype(np.float32)
+
+
+_DCT = _dct_matrix(HASH_IMAGE_SIZE)
+
+
+# Function to decode a small grayscale copy of an image given as JPEG bytes or a path
+def load_gray(source, size=HASH_IMAGE_SIZE):
+    with Image.open(source if isinstance(source, str) else io.BytesIO(source)) as img:
+        # libjpeg scales down in the DCT domain, so a large original costs little to decode
+        img.draft('L', (size * 2, size * 2))
+        return np.asarray(img.convert('L').resize((size, size), Image.BILINEAR), dtype=np.float32)
+
+
+# Function to pack rows of 64 booleans into uint64 hashes
+def _pack(bits):
+    return np.packbits(bits.reshape(len(bits), 64), axis=1).view('>u8').ravel().astype(np.uint64)
+
+
+def phash(images):
+    """64-bit DCT hashes of an (n, 32, 32) stack of grayscale arrays, computed for the whole batch at once."""
+    coefficients = _DCT @ images @ _DCT.T
+    low = coefficients[:, :8, :8].reshape(len(images), 64)
+    # The DC term only reflects overall brightness, so it is left out of the median
+    median = np.median(low[:, 1:], axis=1, keepdims=True)
+    return _pack(low > median)
+
+
+# Function to build the (size_out, size_in) matrix that area-averages a row of pixels down to size_out
+def _area_matrix(size_out, size_in):
+    edges = np.linspace(0, size_in, size_out + 1)
+    pixels = np.arange(size_in)
+    overlap = np.clip(np.minimum(edges[1:, None], pixels[None, :] + 1) - np.maximum(edges[:-1, None], pixels[None, :]), 0, None)
+    return (overlap / overlap.sum(axis=1, keepdims=True)).astype(np.float32)
+
+
+_DHASH_ROWS = _area_matrix(8, HASH_IMAGE_SIZE)
+_DHASH_COLUMNS = _area_matrix(9, HASH_IMAGE_SIZE).T
+
+
+def dhash(images):
+    """64-bit gradient hashes of an (n, 32, 32) stack: is each cell of a 9x8 grid brighter than its left neighbour."""
+    grid = _DHASH_ROWS @ images @ _DHASH_COLUMNS
+    return _pack(grid[:, :, 1:] > grid[:, :, :-1])
+
+
+# Function to count differing bits between every pair of hashes of two arrays
+def _hamming(first, second):
+    xor = first[:, None] ^ second[None, :]
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(xor)
+    # NumPy < 2.0
+    return np.unpackbits(xor.view(np.uint8).reshape(*xor.shape, 8), axis=-1).sum(axis=-1)
+
+
+def group_bursts(sources, threshold=DEFAULT_BURST_THRESHOLD):
+    """Cluster JPEG bytes or paths into bursts of near-identical frames.
+
+    Two frames are linked when both their pHash and dHash distances are at
+    most threshold; clusters are the connected components, so a slowly
+    panning burst stays together. Returns lists of indices in input order,
+    each list sorted, the clusters ordered by their first frame. Images that
+    cannot be decoded are left on their own; the model step reports them.
+    """
+    images, valid = [], []
+    for index, source in enumerate(sources):
+        try:
+            images.append(load_gray(source))
+            valid.append(index)
+        except Exception:
+            continue
+
+    parent = list(range(len(sources)))
+
+    def find(index):
+        while parent[index] != index:
+            parent[index] = parent[parent[index]]
+            index = parent[index]
+        return index
+
+    if images:
+        images = np.stack(images)
+        phashes = phash(images)
+        dhashes = dhash(images)
+    for start in range(0, len(valid), _DISTANCE_BLOCK):
+        end = min(start + _DISTANCE_BLOCK, len(valid))
+        linked = ((_hamming(phashes[start:end], phashes) <= threshold)
+                  & (_hamming(dhashes[start:end], dhashes) <= threshold))
+        for first, second in zip(*np.nonzero(linked)):
+            first, second = valid[int(first) + start], valid[int(second)]
+            if first < second:
+                root_first, root_second = find(first), find(second)
+                if root_first != root_second:
+                    parent[max(root_first, root_second)] = min(root_first, root_second)
+
+    clusters = {}
+    for index in range(len(sources)):
+        clusters.setdefault(find(index), []).append(index)
+    return list(clusters.values())
+
+
+# Function to derive the title of one frame of a burst from the title generated for the burst
+def burst_title(title, number):
+    return f"{title} {number}"
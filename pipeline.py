@@ -0,0 +1,129 @@
+import queue
+import threading
+import traceback
+
+# Default number of items allowed to wait between two stages
+DEFAULT_QUEUE_SIZE = 4
+
+_DONE = object()
+
+
+class Stage:
+    """One step of the pipeline: fn(value) -> value, run by `workers` threads."""
+
+    def __init__(self, name, fn, workers=1):
+        self.name = name
+        self.fn = fn
+        self.workers = workers
+
+
+class PipelineItem:
+    """A file travelling through the pipeline; keeps the first error and the stage it came from."""
+
+    def __init__(self, index, name, value):
+        self.index = index
+        self.name = name
+        self.value = value
+        self.error = None
+        self.failed_stage = None
+        self.traceback = None
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+class PipelineProgress:
+    """Thread-safe per-stage counters of completed and failed items."""
+
+    def __init__(self, stages, total):
+        self.total = total
+        self.done = {stage.name: 0 for stage in stages}
+        self.failed = {stage.name: 0 for stage in stages}
+        self.lock = threading.Lock()
+
+    def record(self, stage_name, ok):
+        with self.lock:
+            if ok:
+                self.done[stage_name] += 1
+            else:
+                self.failed[stage_name] += 1
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.done), dict(self.failed)
+
+
+def _run_stage(stage, inbox, outbox, progress, remaining, remaining_lock):
+    while True:
+        item = inbox.get()
+        if item is _DONE:
+            # Let sibling workers see the marker; the last one to leave forwards it downstream
+            inbox.put(_DONE)
+            with remaining_lock:
+                remaining[stage.name] -= 1
+                last = remaining[stage.name] == 0
+            if last:
+                outbox.put(_DONE)
+            return
+
+        # Failed items skip the remaining stages but still flow to the end, so one bad file never stalls the stream
+        if item.ok:
+            try:
+                item.value = stage.fn(item.value)
+            except Exception as e:
+                item.error = e
+                item.failed_stage = stage.name
+                item.traceback = traceback.format_exc()
+            progress.record(stage.name, item.ok)
+        outbox.put(item)
+
+
+def run_pipeline(inputs, stages, queue_size=DEFAULT_QUEUE_SIZE, on_progress=None, poll_interval=0.2):
+    """Stream (name, value) inputs through the stages and return the items in input order.
+
+    Stages are connected by bounded queues, so the first file reaches the last
+    stage while later files are still in the earlier ones. on_progress(progress)
+    is called from the calling thread (safe for Streamlit updates) every
+    poll_interval seconds and once at the end.
+    """
+    inputs = list(inputs)
+    progress = PipelineProgress(stages, len(inputs))
+    queues = [queue.Queue(maxsize=queue_size) for _ in range(len(stages) + 1)]
+    remaining = {stage.name: max(1, stage.workers) for stage in stages}
+    remaining_lock = threading.Lock()
+
+    def feed():
+        for index, (name, value) in enumerate(inputs):
+            queues[0].put(PipelineItem(index, name, value))
+        queues[0].put(_DONE)
+
+    threads = [threading.Thread(target=feed, daemon=True)]
+    for i, stage in enumerate(stages):
+        for _ in range(max(1, stage.workers)):
+            threads.append(threading.Thread(
+                target=_run_stage,
+                args=(stage, queues[i], queues[i + 1], progress, remaining, remaining_lock),
+                daemon=True,
+            ))
+    for thread in threads:
+        thread.start()
+
+    results = [None] * len(inputs)
+    while True:
+        try:
+            item = queues[-1].get(timeout=poll_interval)
+        except queue.Empty:
+            item = None
+        if item is _DONE:
+            break
+        if item is not None:
+            results[item.index] = item
+        if on_progress:
+            on_progress(progress)
+
+    for thread in threads:
+        thread.join()
+    if on_progress:
+        on_progress(progress)
+    return results
@@ -1,14 +1,14 @@
 import streamlit as st
 import os
 import tempfile
-from PIL import Image
-import iptcinfo3
 import zipfile
-import time
 import traceback
 import unicodedata
 from datetime import datetime, timedelta
 import pytz
+from embedding import embed_batch
+from memory_usage import PeakMemory, format_size
+from spooling import spool_upload
 
 # Set the timezone to UTC+7 Jakarta
 JAKARTA_TZ = pytz.timezone('Asia/Jakarta')
@@ -18,42 +18,6 @@ def normalize_text(text):
     normalized = unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode('utf-8')
     return normalized
 
-def embed_metadata(image_path, metadata, new_filename, progress_placeholder, files_processed, total_files):
-    """Embed metadata into the image and rename it."""
-    try:
-        time.sleep(1)
-
-        # Open the image file
-        img = Image.open(image_path)
-
-        # Load existing IPTC data (if any)
-        iptc_data = iptcinfo3.IPTCInfo(image_path, force=True)
-
-        # Clear existing IPTC metadata
-        for tag in iptc_data._data:
-            iptc_data._data[tag] = []
-
-        # Update IPTC data with new metadata
-        iptc_data['keywords'] = [metadata.get('Tags', '')]  # Tags
-        iptc_data['caption/abstract'] = [metadata.get('Title', '')]  # Title
-
-        # Save the image with the embedded metadata
-        iptc_data.save()
-
-        # Rename the file
-        renamed_path = os.path.join(os.path.dirname(image_path), new_filename)
-        os.rename(image_path, renamed_path)
-
-        # Update progress text
-        files_processed += 1
-        progress_placeholder.text(f"Processing images... {files_processed}/{total_files}")
-
-        return renamed_path
-
-    except Exception as e:
-        st.error(f"An error occurred while embedding metadata: {e}")
-        st.error(traceback.format_exc())
-
 def main():
     """Main function for the Streamlit app."""
     st.title("Image Metadata Editor")
@@ -86,31 +50,37 @@ def main():
             with st.spinner("Processing images..."):
                 try:
                     # Create a temporary directory for processing
-                    with tempfile.TemporaryDirectory() as temp_dir:
+                    with tempfile.TemporaryDirectory() as temp_dir, PeakMemory(reset=False) as memory:
+                        # Stream the uploads to disk in chunks; the embed workers read the spooled files directly
                         image_paths = []
                         for idx, file in enumerate(uploaded_files):
                             temp_image_path = os.path.join(temp_dir, file.name)
-                            with open(temp_image_path, 'wb') as f:
-                                f.write(file.read())
+                            spool_upload(file, temp_image_path)
                             image_paths.append(temp_image_path)
 
-                        total_files = len(image_paths)
-                        files_processed = 0
-
                         # Progress placeholder
                         progress_placeholder = st.empty()
 
-                        # Process and embed metadata
+                        # Embed metadata and rename the images across the process pool
+                        metadata = {
+                            'Title': normalize_text(title_input),
+                            'Tags': normalize_text(tags_input)
+                        }
+                        items = [
+                            (image_path, metadata, f"{normalize_text(title_input)}_{idx + 1}.jpg")
+                            for idx, image_path in enumerate(image_paths)
+                        ]
+                        results = embed_batch(
+                            items,
+                            on_progress=lambda done, total: progress_placeholder.text(f"Processing images... {done}/{total}"),
+                        )
+
                         processed_files = []
-                        for idx, image_path in enumerate(image_paths):
-                            metadata = {
-                                'Title': normalize_text(title_input),
-                                'Tags': normalize_text(tags_input)
-                            }
-                            new_filename = f"{normalize_text(title_input)}_{idx + 1}.jpg"
-                            updated_image_path = embed_metadata(image_path, metadata, new_filename, progress_placeholder, files_processed, total_files)
-                            if updated_image_path:
-                                processed_files.append(updated_image_path)
+                        for image_path, (updated_image_path, error) in zip(image_paths, results):
+                            if error is not None:
+                                st.error(f"An error occurred while embedding metadata into {os.path.basename(image_path)}: {error}")
+                                continue
+                            processed_files.append(updated_image_path)
 
                         # Create a zip file of the processed images
                         zip_filename = os.path.join(temp_dir, "processed_images.zip")
@@ -129,6 +99,9 @@ def main():
 
                         st.success(f"Processed {len(processed_files)} images successfully!")
 
+                    # Sessions share the server process, so its peak since start is shown, not a per-batch figure
+                    st.caption(f"Peak server memory so far: {format_size(memory.peak_rss)}")
+
                 except Exception as e:
                     st.error(f"An error occurred: {e}")
                     st.error(traceback.format_exc())
@@ -0,0 +1,278 @@
+import io
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import metrics
+
+# Number of authenticated connections (and parallel uploads) kept open
+DEFAULT_CONNECTIONS = 4
+
+# SSH flow control: a large window keeps the pipe full on high-latency links
+DEFAULT_WINDOW_SIZE = 16 * 1024 * 1024
+DEFAULT_MAX_PACKET_SIZE = 128 * 1024
+
+# Size of the blocks read from disk and queued as pipelined SFTP writes
+DEFAULT_CHUNK_SIZE = 256 * 1024
+
+# Attempts per file; a dropped transport is reconnected between attempts
+DEFAULT_MAX_ATTEMPTS = 3
+
+
+class TransferResult:
+    """Outcome of one file upload."""
+
+    def __init__(self, local_path, remote_path, size=0, seconds=0.0, attempts=0, error=None, remote_mtime=None):
+        self.local_path = local_path
+        self.remote_path = remote_path
+        self.size = size
+        self.remote_mtime = remote_mtime
+        self.seconds = seconds
+        self.attempts = attempts
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    @property
+    def throughput(self):
+        """Bytes per second for this file."""
+        return self.size / self.seconds if self.seconds > 0 else 0.0
+
+
+class TransferStats:
+    """Aggregate byte and time counters across all uploads of a pool."""
+
+    def __init__(self):
+        self.files = 0
+        self.failed = 0
+        self.bytes = 0
+        self.reconnects = 0
+        self.started = None
+        self.finished = None
+        self.lock = threading.Lock()
+
+    def record(self, result):
+        metrics.observe(metrics.STAGE_SECONDS, result.seconds, stage='sftp_upload')
+        if result.attempts > 1:
+            metrics.inc(metrics.SFTP_RETRIES, result.attempts - 1)
+        if result.ok:
+            metrics.record_bytes('sftp_upload', result.size)
+        else:
+            metrics.inc(metrics.STAGE_ERRORS, stage='sftp_upload')
+        with self.lock:
+            now = time.monotonic()
+            if self.started is None:
+                self.started = now - result.seconds
+            self.finished = now
+            if result.ok:
+                self.files += 1
+                self.bytes += result.size
+            else:
+                self.failed += 1
+
+    @property
+    def throughput(self):
+        """Bytes per second over the wall-clock time of all uploads."""
+        if self.started is None or self.finished <= self.started:
+            return 0.0
+        return self.bytes / (self.finished - self.started)
+
+
+class _Connection:
+    """One authenticated transport with its SFTP channel, reconnected on demand."""
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.transport = None
+        self.sftp = None
+        self.connected = False
+
+    def ensure(self):
+        if self.transport is not None and self.transport.is_active():
+            return self.sftp
+        self.close()
+        pool = self.pool
+        if pool.auth_error is not None:
+            # The credentials were rejected once; retrying them per file only adds failed logins
+            raise pool.auth_error
+        if self.connected:
+            with pool.stats.lock:
+                pool.stats.reconnects += 1
+            metrics.inc(metrics.SFTP_RECONNECTS)
+        import paramiko  # Imported on first connect, so pages load without it
+
+        transport = paramiko.Transport(
+            (pool.host, pool.port),
+            default_window_size=pool.window_size,
+            default_max_packet_size=pool.max_packet_size,
+        )
+        try:
+            transport.connect(username=pool.username, password=pool.password)
+            self.sftp = paramiko.SFTPClient.from_transport(
+                transport,
+                window_size=pool.window_size,
+                max_packet_size=pool.max_packet_size,
+            )
+        except Exception as e:
+            transport.close()
+            if isinstance(e, paramiko.AuthenticationException):
+                pool.auth_error = e
+            raise
+        self.transport = transport
+        self.connected = True
+        return self.sftp
+
+    def close(self):
+        if self.sftp is not None:
+            self.sftp.close()
+        if self.transport is not None:
+            self.transport.close()
+        self.sftp = None
+        self.transport = None
+
+
+class SFTPTransferPool:
+    """Upload files over a pool of reusable, authenticated SFTP connections.
+
+    Connections are opened lazily, shared by every upload on the pool and
+    re-established when the server drops them, so a batch pays for at most
+    `connections` SSH handshakes instead of one per file. Once the server
+    rejects the credentials, every later upload fails with that error
+    without connecting again.
+    """
+
+    def __init__(self, host, port, username, password, connections=DEFAULT_CONNECTIONS,
+                 window_size=DEFAULT_WINDOW_SIZE, max_packet_size=DEFAULT_MAX_PACKET_SIZE,
+                 chunk_size=DEFAULT_CHUNK_SIZE, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.connections = max(1, connections)
+        self.window_size = window_size
+        self.max_packet_size = max_packet_size
+        self.chunk_size = chunk_size
+        self.max_attempts = max_attempts
+        self.stats = TransferStats()
+        self.auth_error = None
+        self._idle = queue.Queue()
+        for _ in range(self.connections):
+            self._idle.put(_Connection(self))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def connect(self):
+        """Open one connection now, raising if the server is unreachable or rejects the credentials."""
+        connection = self._idle.get()
+        try:
+            connection.ensure()
+        finally:
+            self._idle.put(connection)
+
+    def _put(self, sftp, open_source, size, remote_path):
+        with open_source() as source, sftp.open(remote_path, 'wb') as remote_file:
+            # Pipelined writes don't wait for each acknowledgement before sending the next block
+            remote_file.set_pipelined(True)
+            while True:
+                chunk = source.read(self.chunk_size)
+                if not chunk:
+                    break
+                remote_file.write(chunk)
+        attributes = sftp.stat(remote_path)
+        if attributes.st_size != size:
+            raise IOError(f"size mismatch after upload of {remote_path}: {attributes.st_size} != {size}")
+        return attributes
+
+    def _upload(self, open_source, size, label, remote_path):
+        import paramiko
+
+        connection = self._idle.get()
+        start = time.monotonic()
+        try:
+            for attempt in range(1, self.max_attempts + 1):
+                try:
+                    sftp = connection.ensure()
+                    attributes = self._put(sftp, open_source, size, remote_path)
+                    result = TransferResult(label, remote_path, attributes.st_size, time.monotonic() - start,
+                                            attempt, remote_mtime=int(attributes.st_mtime or 0))
+                    self.stats.record(result)
+                    return result
+                except (OSError, EOFError, paramiko.SSHException) as e:
+                    if isinstance(e, paramiko.AuthenticationException) or attempt == self.max_attempts:
+                        self.stats.record(TransferResult(label, remote_path, 0, time.monotonic() - start, attempt, e))
+                        raise
+                    # Force a reconnect for the next attempt
+                    connection.close()
+        finally:
+            self._idle.put(connection)
+
+    def upload(self, local_path, remote_path):
+        """Upload one file, retrying on a fresh connection; raises if every attempt fails."""
+        return self._upload(lambda: open(local_path, 'rb'), os.path.getsize(local_path), local_path, remote_path)
+
+    def upload_bytes(self, data, remote_path):
+        """Upload an in-memory buffer, with the same retries as upload()."""
+        # BytesIO shares the buffer of a bytes object instead of copying it
+        return self._upload(lambda: io.BytesIO(data), len(data), remote_path, remote_path)
+
+    def remote_stat(self, remote_path):
+        """Return the SFTPAttributes of a remote file, or None if it does not exist."""
+        import paramiko
+
+        connection = self._idle.get()
+        try:
+            for attempt in range(1, self.max_attempts + 1):
+                try:
+                    return connection.ensure().stat(remote_path)
+                except FileNotFoundError:
+                    return None
+                except (OSError, EOFError, paramiko.SSHException) as e:
+                    if isinstance(e, paramiko.AuthenticationException) or attempt == self.max_attempts:
+                        raise
+                    connection.close()
+        finally:
+            self._idle.put(connection)
+
+    def upload_many(self, pairs, on_progress=None):
+        """Upload (local_path, remote_path) pairs in parallel; returns TransferResults in input order.
+
+        on_progress(done, total, result) is called from the calling thread.
+        """
+        pairs = list(pairs)
+        results = [None] * len(pairs)
+        with ThreadPoolExecutor(max_workers=self.connections) as executor:
+            futures = {executor.submit(self.upload, local, remote): i for i, (local, remote) in enumerate(pairs)}
+            for done, future in enumerate(as_completed(futures), start=1):
+                i = futures[future]
+                try:
+                    results[i] = future.result()
+                except Exception as e:
+                    local, remote = pairs[i]
+                    results[i] = TransferResult(local, remote, error=e)
+                if on_progress:
+                    on_progress(done, len(pairs), results[i])
+        return results
+
+    def close(self):
+        connections = []
+        while True:
+            try:
+                connections.append(self._idle.get_nowait())
+            except queue.Empty:
+                break
+        for connection in connections:
+            connection.close()
+            self._idle.put(connection)
+
+
+# Function to format a bytes-per-second figure for display
+def format_throughput(bytes_per_second):
+    return f"{bytes_per_second / (1024 * 1024):.2f} MB/s"
@@ -0,0 +1,24 @@
+import shutil
+
+# Bytes written per call while spooling an upload to disk
+SPOOL_CHUNK_SIZE = 1024 * 1024
+
+
+def spool_upload(file, path, chunk_size=SPOOL_CHUNK_SIZE):
+    """Write an uploaded file to path in chunks, without copying it into new bytes objects.
+
+    Streamlit's UploadedFile is a BytesIO over bytes its file manager still
+    holds; getvalue() returns those bytes themselves, which are written
+    through memoryview slices. (getbuffer() would copy them, because they are
+    shared.) Other file objects are copied with shutil.copyfileobj.
+    Returns the number of bytes written.
+    """
+    with open(path, 'wb') as f:
+        if hasattr(file, 'getvalue'):
+            with memoryview(file.getvalue()) as view:
+                for offset in range(0, len(view), chunk_size):
+                    f.write(view[offset:offset + chunk_size])
+                return len(view)
+        file.seek(0)
+        shutil.copyfileobj(file, f, chunk_size)
+        return f.tell()